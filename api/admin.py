@@ -1,6 +1,13 @@
 from django.contrib import admin
-from .models import User, BlacklistedToken
+from .models import User, BlacklistedToken, ScanRule
 
 # Register your models here.
 admin.site.register(User)
-admin.site.register(BlacklistedToken)
\ No newline at end of file
+admin.site.register(BlacklistedToken)
+
+
+@admin.register(ScanRule)
+class ScanRuleAdmin(admin.ModelAdmin):
+    list_display = ('indicator', 'kind', 'locale', 'pattern', 'is_active', 'created_at')
+    list_filter = ('kind', 'locale', 'is_active')
+    search_fields = ('indicator', 'pattern')
\ No newline at end of file
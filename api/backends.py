@@ -1,9 +1,20 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.backends import ModelBackend
 from django.db.models import Q
+from django.db.models.functions import Lower
+
+from .hashers import check_login_password
 
 User = get_user_model()
 
+
+def users_with_email(email):
+    """
+    Case-insensitive email lookup written to match the unique
+    LOWER(email) index, so it is a single index probe.
+    """
+    return User.objects.alias(email_lower=Lower('email')).exclude(email='').filter(email_lower=email.lower())
+
 class EmailOrUsernameModelBackend(ModelBackend):
     """
     Authenticate against either email or username.
@@ -18,12 +29,12 @@ class EmailOrUsernameModelBackend(ModelBackend):
             
         try:
             # Use Q objects to search by either username or email
-            user = User.objects.get(
-                Q(username__iexact=username) | Q(email__iexact=username)
+            user = User.objects.alias(email_lower=Lower('email')).get(
+                Q(username__iexact=username) | (Q(email_lower=username.lower()) & ~Q(email=''))
             )
             
             # Check the password
-            if user.check_password(password):
+            if check_login_password(user, password):
                 return user
         except User.DoesNotExist:
             # Run the default password hasher once to reduce timing difference
@@ -31,11 +42,11 @@ class EmailOrUsernameModelBackend(ModelBackend):
             User().set_password(password)
             return None
         except User.MultipleObjectsReturned:
-            # In case multiple users have the same email (shouldn't happen with proper validation)
+            # Emails are unique, but one user's username can equal another user's email.
             # Try to find the user with exact username match
             try:
                 user = User.objects.get(username=username)
-                if user.check_password(password):
+                if check_login_password(user, password):
                     return user
                 return None
             except (User.DoesNotExist, User.MultipleObjectsReturned):
@@ -0,0 +1,81 @@
+"""
+Password hashing tuned to the host.
+
+``CalibratedPBKDF2PasswordHasher`` is Django's PBKDF2-SHA256 hasher with its
+iteration count read from ``KITO_PBKDF2_ITERATIONS``, which
+``manage.py calibrate_password_hashers`` recommends for a target login
+latency. It keeps the ``pbkdf2_sha256`` algorithm name, so existing hashes
+still verify, and Django's ``check_password`` re-encodes a password at the
+configured cost after its next successful check. Raising or lowering the
+setting, or moving another hasher to the front of ``PASSWORD_HASHERS``,
+therefore never forces a password reset.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, identify_hasher
+
+from .utils.metrics import Counter, Summary
+
+# The decoded field holding each hasher's main work factor.
+COST_FIELDS = ('iterations', 'time_cost', 'work_factor')
+
+login_password_check_seconds = Summary(
+    'login_password_check_seconds', 'Time spent checking passwords at login, including any rehash.',
+    labels=['algorithm'],
+)
+login_password_hash_cost = Summary(
+    'login_password_hash_cost', 'Work factor of the stored password hash checked at login.', labels=['algorithm'],
+)
+password_rehashed_total = Counter(
+    'password_rehashed_total', 'Passwords re-encoded at login to match the configured hasher.',
+    labels=['algorithm', 'direction'],
+)
+
+
+class CalibratedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return settings.KITO_PBKDF2_ITERATIONS or PBKDF2PasswordHasher.iterations
+
+
+def hash_cost(encoded):
+    """
+    Return ``(algorithm, work factor)`` of an encoded password, or ``None``
+    if it is unusable or its hasher is not installed.
+    """
+    try:
+        hasher = identify_hasher(encoded)
+        decoded = hasher.decode(encoded)
+    except ValueError:
+        return None
+    cost = next((decoded[field] for field in COST_FIELDS if field in decoded), 0)
+    return hasher.algorithm, cost
+
+
+def check_login_password(user, password):
+    """
+    ``user.check_password`` for login views and backends, recording the
+    cost of the stored hash and any transparent rehash it triggered.
+    """
+    before = hash_cost(user.password)
+    if before is None:
+        return user.check_password(password)
+
+    encoded = user.password
+    start = time.perf_counter()
+    valid = user.check_password(password)
+    login_password_check_seconds.observe(time.perf_counter() - start, algorithm=before[0])
+    login_password_hash_cost.observe(before[1], algorithm=before[0])
+
+    after = hash_cost(user.password) if user.password != encoded else None
+    if after is not None:
+        if after[0] != before[0]:
+            direction = 'algorithm'
+        elif after[1] != before[1]:
+            direction = 'upgrade' if after[1] > before[1] else 'downgrade'
+        else:
+            # Same cost; Django also rehashes to lengthen short salts.
+            direction = 'salt'
+        password_rehashed_total.inc(algorithm=after[0], direction=direction)
+    return valid
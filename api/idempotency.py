@@ -0,0 +1,230 @@
+"""
+``Idempotency-Key`` support for POST endpoints.
+
+A client that may retry a POST sends a unique ``Idempotency-Key`` header
+(a UUID, say). The first request with a key claims it with an atomic
+``cache.add`` and runs normally; its completed response is stored in the
+shared cache for ``KITO_IDEMPOTENCY_TTL`` seconds and replayed, with an
+``Idempotent-Replayed: true`` header, for any retry. A retry arriving while
+the first request is still running gets 409 straight away, with a
+``Retry-After`` of ``KITO_IDEMPOTENCY_RETRY_AFTER`` seconds, instead of
+doing the work again. It is not made to wait: sync views share one thread
+per worker under ASGI, so sleeping there would stall every other request,
+including the streamed response of the very request it waits for.
+
+Keys are scoped to the authenticated user and bound to a fingerprint of
+the request, so reusing a key for a different request is a 422 rather
+than a replay of someone else's response. Server errors and throttled
+responses are not stored, so those can be retried for real.
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from .utils.metrics import Counter
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+# Per-response headers set again by the view on replay.
+UNSTORED_HEADERS = {'allow', 'vary'}
+
+idempotency_replays_total = Counter(
+    'idempotency_replays_total', 'Responses replayed for retried Idempotency-Key requests.',
+)
+
+
+class IdempotencyKeyInUse(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'A request with this Idempotency-Key is still being processed.'
+    default_code = 'idempotency_key_in_use'
+
+    def __init__(self, wait):
+        super().__init__()
+        # DRF's exception handler sends this as Retry-After.
+        self.wait = wait
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This Idempotency-Key was already used for a different request.'
+    default_code = 'idempotency_key_reused'
+
+
+class Replay(Exception):
+    """
+    Raised from ``initial`` to short-circuit the view with a stored response.
+    """
+    def __init__(self, response):
+        self.response = response
+
+
+def request_fingerprint(request):
+    """
+    Hash of the method, path and payload of a DRF request. Multipart
+    uploads are hashed from the parsed files, chunk by chunk, so large
+    archives never have to be held in memory.
+    """
+    digest = hashlib.sha256(f'{request.method} {request.get_full_path()}\n'.encode())
+    if request.content_type.startswith('multipart/'):
+        for name, values in sorted(request.POST.lists()):
+            digest.update(repr((name, values)).encode())
+        for name, uploads in sorted(request.FILES.lists()):
+            for upload in uploads:
+                digest.update(repr((name, upload.name, upload.size)).encode())
+                for chunk in upload.chunks():
+                    digest.update(chunk)
+                upload.seek(0)
+    else:
+        digest.update(request.body)
+    return digest.hexdigest()
+
+
+class IdempotencyClaim:
+    """
+    The in-flight lock on one idempotency key, held by the request doing
+    the work until its response is stored or abandoned.
+    """
+    def __init__(self, cache_key, fingerprint):
+        self.cache_key = cache_key
+        self.lock_key = cache_key + ':lock'
+        self.fingerprint = fingerprint
+        self.token = uuid.uuid4().hex
+
+    @classmethod
+    def acquire(cls, scope, key, fingerprint):
+        """
+        Return a claim on ``key``, raise ``Replay`` with the stored response
+        if the request that held it has finished, or ``IdempotencyKeyInUse``
+        while it is still running.
+        """
+        cache_key = 'idempotency:' + hashlib.sha256(f'{scope}:{key}'.encode()).hexdigest()
+        claim = cls(cache_key, fingerprint)
+        # Twice: the holder may finish between the first read and the add.
+        for _ in range(2):
+            stored = cache.get(cache_key)
+            if stored is not None:
+                claim.check(stored['fingerprint'])
+                idempotency_replays_total.inc()
+                raise Replay(replayed(stored))
+            if cache.add(claim.lock_key, (claim.token, fingerprint), settings.KITO_IDEMPOTENCY_LOCK_TIMEOUT):
+                return claim
+            holder = cache.get(claim.lock_key)
+            if holder is not None:
+                claim.check(holder[1])
+                break
+        raise IdempotencyKeyInUse(settings.KITO_IDEMPOTENCY_RETRY_AFTER)
+
+    def check(self, fingerprint):
+        if fingerprint != self.fingerprint:
+            raise IdempotencyKeyReused()
+
+    def complete(self, response):
+        """
+        Store ``response`` for replay (streaming responses once they have
+        been sent in full) and release the key. Returns the response to send.
+        """
+        if not storable(response):
+            self.release()
+        elif response.streaming:
+            response.streaming_content = self.recording(response, response.streaming_content)
+        else:
+            if hasattr(response, 'render'):
+                response.render()
+            self.store(response, response.content)
+            self.release()
+        return response
+
+    def recording(self, response, chunks):
+        sent = []
+        size = 0
+        overflow = False
+        try:
+            for chunk in chunks:
+                if not overflow:
+                    size += len(chunk)
+                    # A truncated body must never be replayed as complete.
+                    overflow = size > settings.KITO_IDEMPOTENCY_MAX_BYTES
+                    if overflow:
+                        sent.clear()
+                    else:
+                        sent.append(chunk)
+                yield chunk
+            if not overflow:
+                self.store(response, b''.join(sent))
+        finally:
+            self.release()
+
+    def store(self, response, content):
+        if len(content) > settings.KITO_IDEMPOTENCY_MAX_BYTES:
+            return
+        cache.set(self.cache_key, {
+            'fingerprint': self.fingerprint,
+            'status': response.status_code,
+            'headers': [(name, value) for name, value in response.items() if name.lower() not in UNSTORED_HEADERS],
+            'content': content,
+        }, settings.KITO_IDEMPOTENCY_TTL)
+
+    def release(self):
+        # The cache has no compare-and-delete; don't drop a lock that
+        # expired and was claimed by another request.
+        holder = cache.get(self.lock_key)
+        if holder is not None and holder[0] == self.token:
+            cache.delete(self.lock_key)
+
+
+def storable(response):
+    return response.status_code < 500 and response.status_code != status.HTTP_429_TOO_MANY_REQUESTS
+
+
+def replayed(stored):
+    response = HttpResponse(stored['content'], status=stored['status'])
+    for name, value in stored['headers']:
+        response[name] = value
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+class IdempotentMixin:
+    """
+    Honour ``Idempotency-Key`` on POST requests to an ``APIView``.
+
+    The key is checked after authentication but before permissions and
+    throttles, so a replayed retry is not charged against scan quotas.
+    """
+    def initial(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is not None and request.method == 'POST':
+            if not key or len(key) > MAX_KEY_LENGTH:
+                raise ValidationError({HEADER: f'Must be 1 to {MAX_KEY_LENGTH} characters.'})
+            user = request.user
+            scope = f'user:{user.pk}' if user and user.is_authenticated else 'anon'
+            self.idempotency_claim = IdempotencyClaim.acquire(scope, key, request_fingerprint(request))
+        super().initial(request, *args, **kwargs)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, Replay):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        claim = self.__dict__.pop('idempotency_claim', None)
+        if claim is not None:
+            response = claim.complete(response)
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # An unhandled error skipped finalize_response; let retries run.
+            claim = self.__dict__.pop('idempotency_claim', None)
+            if claim is not None:
+                claim.release()
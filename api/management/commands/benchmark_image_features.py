@@ -0,0 +1,66 @@
+import io
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from api.utils.features import extract_features, to_batch
+from api.utils.images import analyze_images, load_image, open_image
+
+
+def synthetic_image(rng, width, height, image_format):
+    """
+    A photo-like test image: smooth colour gradients plus sensor noise.
+    """
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    phase = rng.uniform(0, 2 * np.pi, 3)
+    pixels = np.stack([
+        127 + 100 * np.sin(x / rng.uniform(40, 200) + y / rng.uniform(40, 200) + p) for p in phase
+    ], axis=-1)
+    pixels += rng.normal(0, 12, pixels.shape)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels.clip(0, 255).astype(np.uint8)).save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = "Measure image feature extraction throughput, in images per second on one core."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', type=int, default=128, help='Images per round.')
+        parser.add_argument('--width', type=int, default=1280)
+        parser.add_argument('--height', type=int, default=960)
+        parser.add_argument('--format', default='JPEG', choices=['JPEG', 'PNG'])
+        parser.add_argument('--batch-sizes', default='1,16,64', help='Comma-separated batch sizes to compare.')
+        parser.add_argument('--rounds', type=int, default=3)
+
+    def best_rate(self, rounds, n, run):
+        # Keep the best round so noise from other processes doesn't count.
+        best = float('inf')
+        for _ in range(rounds):
+            start = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - start)
+        return n / best
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        n = options['images']
+        # A few distinct images, repeated, keep setup time down.
+        samples = [
+            synthetic_image(rng, options['width'], options['height'], options['format']) for _ in range(min(n, 8))
+        ]
+        items = [(f'{i}.img', samples[i % len(samples)]) for i in range(n)]
+        self.stdout.write(f"{n} {options['width']}x{options['height']} {options['format']} images, single process")
+
+        for batch_size in [int(size) for size in options['batch_sizes'].split(',')]:
+            batches = [items[i:i + batch_size] for i in range(0, n, batch_size)]
+            rate = self.best_rate(options['rounds'], n, lambda: [analyze_images(batch) for batch in batches])
+            self.stdout.write(f'decode + features, batch {batch_size}: {rate:.1f} images/s')
+
+        # Features alone, on images that are already decoded.
+        images = [load_image(open_image(data)) for _, data in items[:len(samples)]] * (n // len(samples) + 1)
+        images = images[:n]
+        rate = self.best_rate(options['rounds'], n, lambda: extract_features(to_batch(images)))
+        self.stdout.write(f'features only (thumbnail + vectorised pass): {rate:.1f} images/s')
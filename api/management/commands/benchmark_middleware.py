@@ -0,0 +1,68 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+User = get_user_model()
+
+# The middleware stack before API routes were made stateless.
+FULL_MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+]
+
+
+class Command(BaseCommand):
+    help = "Compare per-request overhead of the full and the route-aware middleware stacks on API endpoints."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per round.')
+        parser.add_argument('--rounds', type=int, default=5)
+
+    def time_requests(self, n, send):
+        start = time.perf_counter()
+        for _ in range(n):
+            send()
+        return (time.perf_counter() - start) / n * 1e6
+
+    def handle(self, *args, **options):
+        n = options['requests']
+        with transaction.atomic():
+            user = User.objects.create_user(username='__middleware_benchmark__', password=None)
+            auth = f'Bearer {AccessToken.for_user(user)}'
+            endpoints = {
+                '/api/chat-scan/': lambda client: client.post(
+                    reverse('chat-scan'), {'transcript': 'Hey, how was your day?'}, content_type='application/json'
+                ),
+                '/api/user/details/': lambda client: client.get(reverse('user-profile'), HTTP_AUTHORIZATION=auth),
+            }
+
+            stacks = (('full', FULL_MIDDLEWARE), ('lean', None))
+            for path, request in endpoints.items():
+                # Alternate the stacks round by round and keep each one's best
+                # round, so drift and noise affect both sides equally.
+                results = {label: float('inf') for label, _ in stacks}
+                for _ in range(options['rounds']):
+                    for label, middleware in stacks:
+                        overrides = {'MIDDLEWARE': middleware} if middleware else {}
+                        with override_settings(**overrides):
+                            client = Client()
+                            request(client)  # warm up: loads the middleware chain
+                            results[label] = min(results[label], self.time_requests(n, lambda: request(client)))
+                saved = results['full'] - results['lean']
+                self.stdout.write(
+                    f"{path}: full {results['full']:.1f} us/req, lean {results['lean']:.1f} us/req, "
+                    f"saved {saved:.1f} us/req ({saved / results['full']:.0%})"
+                )
+            transaction.set_rollback(True)
@@ -0,0 +1,29 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from api.utils.artifacts import artifact_store
+from api.utils.classifier import ARTIFACT_NAME, HashedNgramClassifier, load_seed_corpus
+
+
+class Command(BaseCommand):
+    help = "Train the scan models and atomically publish them as memory-mapped artifacts."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--corpus',
+            help='JSON file with "kito" and "safe" transcript lists (defaults to the bundled seed corpus).',
+        )
+
+    def handle(self, *args, **options):
+        if options['corpus']:
+            with open(options['corpus'], encoding='utf-8') as f:
+                corpus = json.load(f)
+            texts = corpus['kito'] + corpus['safe']
+            labels = [True] * len(corpus['kito']) + [False] * len(corpus['safe'])
+        else:
+            texts, labels = load_seed_corpus()
+
+        model = HashedNgramClassifier.fit(texts, labels)
+        path = model.save(artifact_store.path_for(ARTIFACT_NAME))
+        self.stdout.write(self.style.SUCCESS(f'Wrote {path} ({len(texts)} transcripts)'))
@@ -0,0 +1,203 @@
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from api.utils.email import send_welcome_emails
+
+User = get_user_model()
+
+REQUIRED_FIELDS = ('username', 'email', 'password')
+OPTIONAL_FIELDS = ('first_name', 'last_name')
+
+
+def _init_worker():
+    # Spawned (non-forked) workers need Django configured before hashing.
+    django.setup()
+
+
+def read_rows(stream, fmt, on_error=None):
+    """
+    Yield one dict per user from a CSV or NDJSON stream without loading it all.
+    NDJSON lines that are not JSON objects yield ``None``, after calling
+    ``on_error(line_number, message)``.
+    """
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            row, message = None, f'malformed JSON ({e})'
+        else:
+            message = 'not a JSON object'
+        if not isinstance(row, dict):
+            if on_error is not None:
+                on_error(line_number, message)
+            row = None
+        yield row
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = (
+        "Import users from a CSV or NDJSON file (username, email, password[, first_name, last_name]). "
+        "Passwords are hashed in a process pool and users are inserted in chunks with bulk_create; "
+        "rows whose username or email already exist are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or '-' for stdin.")
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Defaults to the file extension.')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--send-welcome', action='store_true', help='Send welcome emails over one SMTP connection.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'ndjson' if path != '-' else None)
+        if fmt is None:
+            raise CommandError('--format is required when reading from stdin')
+
+        self.created = self.skipped = self.invalid = self.emailed = 0
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        connection = get_connection() if options['send_welcome'] else None
+        try:
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as pool:
+                if connection is not None:
+                    connection.open()
+                rows = read_rows(stream, fmt, on_error=self.report_malformed)
+                for chunk in chunked(rows, options['chunk_size']):
+                    self.import_chunk(chunk, pool, connection, options['workers'])
+        finally:
+            if connection is not None:
+                connection.close()
+            if stream is not sys.stdin:
+                stream.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {self.created} users, skipped {self.skipped} duplicates, '
+            f'{self.invalid} invalid rows, sent {self.emailed} welcome emails.'
+        ))
+
+    def report_malformed(self, line_number, message):
+        self.stderr.write(f'Line {line_number}: {message}, skipped.')
+
+    @staticmethod
+    def clean_row(row):
+        """
+        Return ``row`` with its fields stripped (passwords are kept as
+        given, like Django's password forms), or ``None`` if a required
+        field is missing or empty or any field is not a string (NDJSON rows
+        can hold numbers, lists or null).
+        """
+        if row is None:
+            return None
+        fields = {field: row.get(field) for field in REQUIRED_FIELDS + OPTIONAL_FIELDS if row.get(field) is not None}
+        if not all(isinstance(value, str) for value in fields.values()):
+            return None
+        fields = {field: value if field == 'password' else value.strip() for field, value in fields.items()}
+        if not all(fields.get(field) for field in REQUIRED_FIELDS):
+            return None
+        return fields
+
+    def clean_chunk(self, rows):
+        """
+        Drop invalid rows and rows that duplicate each other or existing users.
+        """
+        candidates = []
+        seen_usernames = set()
+        seen_emails = set()
+        username_validators = User._meta.get_field(User.USERNAME_FIELD).validators
+        for row in rows:
+            row = self.clean_row(row)
+            if row is None:
+                self.invalid += 1
+                continue
+            try:
+                validate_email(row['email'])
+                for validator in username_validators:
+                    validator(row['username'])
+            except ValidationError:
+                self.invalid += 1
+                continue
+            email = row['email'].lower()
+            if row['username'] in seen_usernames or email in seen_emails:
+                self.skipped += 1
+                continue
+            seen_usernames.add(row['username'])
+            seen_emails.add(email)
+            candidates.append(row)
+
+        existing = (
+            User.objects.annotate(email_lower=Lower('email'))
+            .filter(Q(username__in=seen_usernames) | Q(email_lower__in=seen_emails))
+            .values_list('username', 'email_lower')
+        )
+        taken_usernames = set()
+        taken_emails = set()
+        for username, email in existing:
+            taken_usernames.add(username)
+            taken_emails.add(email)
+
+        fresh = [
+            row for row in candidates
+            if row['username'] not in taken_usernames and row['email'].lower() not in taken_emails
+        ]
+        self.skipped += len(candidates) - len(fresh)
+        return fresh
+
+    def import_chunk(self, rows, pool, connection, workers):
+        rows = self.clean_chunk(rows)
+        if not rows:
+            return
+
+        passwords = [row['password'] for row in rows]
+        hashes = pool.map(make_password, passwords, chunksize=max(1, len(passwords) // (workers * 4)))
+        users = [
+            User(
+                username=row['username'],
+                email=row['email'],
+                password=hashed,
+                **{field: row[field] for field in OPTIONAL_FIELDS if row.get(field)},
+            )
+            for row, hashed in zip(rows, hashes)
+        ]
+
+        with transaction.atomic():
+            # Concurrent signups can still race us; let the database skip those.
+            User.objects.bulk_create(users, ignore_conflicts=True)
+        # With ignore_conflicts no primary keys come back, so find which rows
+        # landed by matching the freshly salted hashes we generated.
+        hashes_by_username = {user.username: user.password for user in users}
+        created = [
+            user for user in User.objects.filter(username__in=hashes_by_username).only('username', 'email', 'password')
+            if hashes_by_username[user.username] == user.password
+        ]
+        self.created += len(created)
+        self.skipped += len(users) - len(created)
+
+        if connection is not None:
+            self.emailed += send_welcome_emails(created, connection)
@@ -0,0 +1,96 @@
+import math
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, get_hashers
+from django.core.management.base import BaseCommand
+
+from api.hashers import CalibratedPBKDF2PasswordHasher
+
+# Hasher attribute holding the work factor, and how the cost grows with it:
+# linearly, or doubling per step.
+COST_PARAMETERS = {
+    'iterations': 'linear',
+    'time_cost': 'linear',
+    'rounds': 'exponential',
+    'work_factor': 'exponential',
+}
+
+# OpenSSL's default scrypt memory limit, used when the hasher sets maxmem=0.
+SCRYPT_DEFAULT_MAXMEM = 32 * 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = "Benchmark the installed password hashers and recommend work factors for a target login latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-ms', type=float, default=250, help='Target time for one password check.')
+        parser.add_argument('--samples', type=int, default=5, help='Hashes timed per measurement; the fastest counts.')
+
+    def cost_parameter(self, hasher):
+        return next((name for name in COST_PARAMETERS if hasattr(hasher, name)), None)
+
+    def measure(self, hasher, parameter, value, samples):
+        # A subclass, because the calibrated hasher's cost is a read-only property.
+        probe = type(hasher.__class__.__name__, (hasher.__class__,), {parameter: value})()
+        best = float('inf')
+        for _ in range(samples):
+            salt = probe.salt()
+            start = time.perf_counter()
+            probe.encode('calibration-password', salt)
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    def recommend(self, hasher, parameter, value, seconds, target):
+        if COST_PARAMETERS[parameter] == 'linear':
+            recommended = value * target / seconds
+            # Round PBKDF2 counts to a readable 10,000; keep small counts exact.
+            step = 10_000 if value >= 10_000 else 1
+            return max(int(recommended // step) * step, 1)
+        steps = math.floor(math.log2(target / seconds))
+        if parameter == 'rounds':
+            return max(value + steps, 4)
+        # scrypt's work factor is N itself, a power of two bounded by memory.
+        recommended = 2 ** max(int(math.log2(value)) + steps, 1)
+        maxmem = hasher.maxmem or SCRYPT_DEFAULT_MAXMEM
+        # OpenSSL needs 128 * r * (N + p + 2) bytes.
+        while recommended > 2 and 128 * hasher.block_size * (recommended + hasher.parallelism + 2) > maxmem:
+            recommended //= 2
+        return recommended
+
+    def handle(self, *args, **options):
+        target = options['target_ms'] / 1000
+        self.stdout.write(f"Target: {options['target_ms']:.0f} ms per password check on one core")
+        for index, hasher in enumerate(get_hashers()):
+            label = f'{hasher.algorithm} ({hasher.__class__.__name__})'
+            parameter = self.cost_parameter(hasher)
+            try:
+                if hasher.library:
+                    hasher._load_library()
+            except ValueError:
+                self.stdout.write(f'{label}: not installed, skipped')
+                continue
+            if parameter is None:
+                self.stdout.write(f'{label}: no tunable work factor, skipped')
+                continue
+
+            value = getattr(hasher, parameter)
+            seconds = self.measure(hasher, parameter, value, options['samples'])
+            recommended = self.recommend(hasher, parameter, value, seconds, target)
+            expected = self.measure(hasher, parameter, recommended, options['samples'])
+            self.stdout.write(
+                f'{label}{" [default]" if index == 0 else ""}: {parameter}={value} takes {seconds * 1000:.1f} ms; '
+                f'recommended {parameter}={recommended} ({expected * 1000:.1f} ms)'
+            )
+
+            if isinstance(hasher, CalibratedPBKDF2PasswordHasher):
+                line = f'KITO_PBKDF2_ITERATIONS={recommended}'
+                if recommended < PBKDF2PasswordHasher.iterations:
+                    self.stdout.write(self.style.WARNING(
+                        f'  {line} is below Django\'s default of {PBKDF2PasswordHasher.iterations}; '
+                        f'prefer a higher target or faster hardware over weaker hashes.'
+                    ))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f'  Set {line}'))
+        if settings.KITO_PBKDF2_ITERATIONS:
+            self.stdout.write(f'Currently configured: KITO_PBKDF2_ITERATIONS={settings.KITO_PBKDF2_ITERATIONS}')
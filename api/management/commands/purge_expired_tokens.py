@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from api.tokens import purge_expired_tokens
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired rows from the token ledger, simplejwt's outstanding/blacklisted "
+        "tokens and the logout blacklist in small batches. Meant to run on a schedule."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches.')
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_tokens(batch_size=options['batch_size'], pause=options['pause'])
+        for table, count in deleted.items():
+            self.stdout.write(f'{table}: deleted {count} rows')
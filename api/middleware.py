@@ -0,0 +1,74 @@
+"""
+Route-aware middleware wrappers.
+
+API clients authenticate with Bearer JWTs and never use sessions, cookies,
+CSRF tokens or flash messages, yet every ``/api/`` request used to pay for
+that machinery. Each class below extends one stock middleware and bypasses it
+for paths under ``STATELESS_PATH_PREFIXES``, while ``/admin/`` and every
+other path keep the full behaviour.
+"""
+from django.conf import settings
+from django.contrib.auth import middleware as auth_middleware
+from django.contrib.messages import middleware as messages_middleware
+from django.contrib.sessions import middleware as sessions_middleware
+from django.middleware import csrf
+from whitenoise import middleware as whitenoise_middleware
+
+HOOKS = ('process_view', 'process_exception', 'process_template_response')
+
+
+def is_stateless(request):
+    prefixes = getattr(settings, 'STATELESS_PATH_PREFIXES', ())
+    return request.path_info.startswith(tuple(prefixes))
+
+
+class StatefulOnlyMixin:
+    """
+    Skip the wrapped middleware entirely for stateless (API) paths.
+
+    Subclassing the stock middleware keeps Django's admin system checks and
+    sync/async capabilities intact.
+    """
+    def __init__(self, get_response, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        # The handler only calls hooks the middleware has, so scope the
+        # existing ones rather than defining new ones here.
+        for hook in HOOKS:
+            if hasattr(self, hook):
+                setattr(self, hook, self._scoped_hook(hook, getattr(self, hook)))
+
+    @staticmethod
+    def _scoped_hook(name, hook):
+        def scoped(request, *args, **kwargs):
+            if is_stateless(request):
+                # process_template_response must hand the response back.
+                return args[0] if name == 'process_template_response' else None
+            return hook(request, *args, **kwargs)
+        return scoped
+
+    def __call__(self, request):
+        if is_stateless(request):
+            # In async mode this returns the coroutine, as MiddlewareMixin does.
+            return self.get_response(request)
+        return super().__call__(request)
+
+
+class SessionMiddleware(StatefulOnlyMixin, sessions_middleware.SessionMiddleware):
+    pass
+
+
+class WhiteNoiseMiddleware(StatefulOnlyMixin, whitenoise_middleware.WhiteNoiseMiddleware):
+    pass
+
+
+class CsrfViewMiddleware(StatefulOnlyMixin, csrf.CsrfViewMiddleware):
+    pass
+
+
+class AuthenticationMiddleware(StatefulOnlyMixin, auth_middleware.AuthenticationMiddleware):
+    # Needs the session; DRF's JWTAuthentication sets request.user for API views.
+    pass
+
+
+class MessageMiddleware(StatefulOnlyMixin, messages_middleware.MessageMiddleware):
+    pass
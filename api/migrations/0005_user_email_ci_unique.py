@@ -0,0 +1,105 @@
+# Generated by Django 5.1.6 on 2026-10-19 05:11
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+
+# api.User carries its own constraint; while the project still authenticates
+# against a different user model (AUTH_USER_MODEL), add the same
+# case-insensitive unique index to that model's table.
+#
+# That index is raw DDL on another app's table (contrib auth_user), so it is
+# not part of Django's model state: makemigrations and the autodetector do
+# not know about it, and nothing but this migration's reverse drops it. It
+# must be dropped here (by migrating back past 0005) before AUTH_USER_MODEL
+# is switched to api.User, which carries the same rule as a real constraint.
+def index_name(table):
+    return f'{table}_email_ci_unique'
+
+
+# Conflicting groups listed in the error; the rest are counted.
+MAX_REPORTED_DUPLICATES = 50
+
+
+def duplicate_emails(model):
+    """
+    Groups of accounts whose non-empty emails differ only in case, as
+    ``{lowercased email: [(pk, username, email), ...]}``.
+    """
+    emails = (
+        model.objects.exclude(email='').annotate(email_lower=Lower('email'))
+        .values('email_lower').annotate(accounts=Count('pk')).filter(accounts__gt=1)
+        .values_list('email_lower', flat=True)
+    )
+    groups = {}
+    rows = (
+        model.objects.annotate(email_lower=Lower('email')).filter(email_lower__in=list(emails))
+        .exclude(email='').order_by('email_lower', 'pk').values_list('email_lower', 'pk', 'username', 'email')
+    )
+    for email_lower, pk, username, email in rows:
+        groups.setdefault(email_lower, []).append((pk, username, email))
+    return groups
+
+
+def check_duplicate_emails(apps, schema_editor):
+    """
+    Refuse to migrate while existing accounts share an email up to case;
+    the unique index would otherwise fail part-way through. Resolve each
+    group by changing or clearing the email of all but one account (an
+    empty email is exempt from the constraint), then migrate again.
+    """
+    models_to_check = {apps.get_model('api', 'User'), apps.get_model(settings.AUTH_USER_MODEL)}
+    problems = []
+    for model in models_to_check:
+        for email, accounts in duplicate_emails(model).items():
+            listed = ', '.join(f'id={pk} username={username!r} email={address!r}' for pk, username, address in accounts)
+            problems.append(f'{model._meta.db_table}: {email}: {listed}')
+    if problems:
+        shown = problems[:MAX_REPORTED_DUPLICATES]
+        if len(problems) > len(shown):
+            shown.append(f'... and {len(problems) - len(shown)} more')
+        raise RuntimeError(
+            'Cannot add the case-insensitive unique email constraint: these accounts share an email. '
+            'Change or clear the email of all but one account in each group, then migrate again.\n'
+            + '\n'.join(shown)
+        )
+
+
+def add_active_user_email_index(apps, schema_editor):
+    model = apps.get_model(settings.AUTH_USER_MODEL)
+    if model._meta.label == 'api.User':
+        return
+    qn = schema_editor.quote_name
+    table = model._meta.db_table
+    schema_editor.execute(
+        f"CREATE UNIQUE INDEX {qn(index_name(table))} ON {qn(table)} (LOWER({qn('email')})) "
+        f"WHERE NOT ({qn('email')} = '')"
+    )
+
+
+def drop_active_user_email_index(apps, schema_editor):
+    model = apps.get_model(settings.AUTH_USER_MODEL)
+    if model._meta.label == 'api.User':
+        return
+    schema_editor.execute(f'DROP INDEX {schema_editor.quote_name(index_name(model._meta.db_table))}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_tokenledgerentry'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_emails, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('email'), condition=models.Q(('email', ''), _negated=True), name='api_user_email_ci_unique'),
+        ),
+        migrations.RunPython(add_active_user_email_index, drop_active_user_email_index),
+    ]
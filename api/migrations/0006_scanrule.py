@@ -0,0 +1,24 @@
+# Generated by Django 5.1.6 on 2026-10-19 05:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_user_email_ci_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('indicator', models.CharField(help_text='Name reported when the rule matches.', max_length=100)),
+                ('pattern', models.TextField(help_text='Matched against lowercased text with homoglyphs, accents and leetspeak folded and whitespace collapsed. Lookbehinds and possessive quantifiers are not supported.')),
+                ('kind', models.CharField(choices=[('phrase', 'Phrase'), ('regex', 'Regular expression')], default='phrase', max_length=10)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-19 05:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_scanrule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanrule',
+            name='locale',
+            field=models.CharField(blank=True, db_index=True, help_text='Keyword pack locale, e.g. "en", "pcm", "yo" or "ha". Leave blank to scan every transcript.', max_length=10),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.6 on 2026-10-19 05:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_scanusage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('chat', 'Chat'), ('image', 'Image')], max_length=10)),
+                ('verdict', models.CharField(choices=[('safe', 'Safe'), ('flagged', 'Flagged')], max_length=10)),
+                ('confidence', models.FloatField(blank=True, null=True)),
+                ('indicators', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-created_at', '-id'], include=('kind', 'verdict', 'confidence', 'indicators'), name='api_scanrecord_history_idx'), models.Index(fields=['user', 'verdict', '-created_at', '-id'], include=('kind', 'confidence', 'indicators'), name='api_scanrecord_verdict_idx')],
+            },
+        ),
+    ]
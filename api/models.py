@@ -1,8 +1,18 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser, Group, Permission
 from django.db import models
+from django.core.exceptions import ValidationError
+from django.db.models.functions import Lower
+
+from .utils.locales import available_locales
+from .utils.rules import RuleError, compile_rule
+
+# Suffix of the case-insensitive unique email index on the user table; used to
+# recognise which unique constraint a failed signup INSERT ran into.
+EMAIL_UNIQUE_SUFFIX = 'email_ci_unique'
 
 class User(AbstractUser):
     groups = models.ManyToManyField(
@@ -20,7 +30,115 @@ class User(AbstractUser):
         verbose_name='user permissions'
     )
 
+    class Meta(AbstractUser.Meta):
+        constraints = [
+            models.UniqueConstraint(
+                Lower('email'),
+                condition=~models.Q(email=''),
+                name=f'api_user_{EMAIL_UNIQUE_SUFFIX}',
+            ),
+        ]
+
 
 class BlacklistedToken(models.Model):
     token = models.CharField(max_length=500, unique=True)
-    blacklisted_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    blacklisted_at = models.DateTimeField(auto_now_add=True)
+
+class TokenLedgerEntry(models.Model):
+    """
+    Compact record of an issued refresh token, written instead of simplejwt's
+    ``OutstandingToken`` row when ``KITO_TOKEN_LEDGER`` is enabled.
+    """
+    jti = models.CharField(max_length=64, primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    expires_at = models.DateTimeField(db_index=True)
+
+
+class ScanRule(models.Model):
+    """
+    A moderator-defined indicator, matched by the scan engine alongside the
+    built-in keywords. Patterns are matched against normalised transcripts.
+    """
+    PHRASE = 'phrase'
+    REGEX = 'regex'
+    KIND_CHOICES = [(PHRASE, 'Phrase'), (REGEX, 'Regular expression')]
+
+    indicator = models.CharField(max_length=100, help_text='Name reported when the rule matches.')
+    pattern = models.TextField(
+        help_text=(
+            'Matched against lowercased text with homoglyphs, accents and leetspeak folded '
+            'and whitespace collapsed. Lookbehinds and possessive quantifiers are not supported.'
+        ),
+    )
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default=PHRASE)
+    locale = models.CharField(
+        max_length=10, blank=True, db_index=True,
+        help_text='Keyword pack locale, e.g. "en", "pcm", "yo" or "ha". Leave blank to scan every transcript.',
+    )
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.indicator
+
+    def clean(self):
+        if self.locale and self.locale not in available_locales():
+            raise ValidationError({'locale': f'Unknown locale; expected one of {", ".join(available_locales())}.'})
+        try:
+            compile_rule(self.indicator, self.pattern, self.kind)
+        except RuleError as exc:
+            raise ValidationError({'pattern': str(exc)})
+
+
+class ScanUsage(models.Model):
+    """
+    Durable daily scan count per user, written behind the cache counters
+    (see ``api.usage``).
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    day = models.DateField()
+    scans = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='api_scanusage_user_day_unique'),
+        ]
+
+
+class ScanRecord(models.Model):
+    """
+    One scan result in a user's history. Listed newest first with keyset
+    pagination, so both indexes lead with the user and end with the
+    ``(created_at, id)`` sort key, and include the listed columns so pages
+    can be served from the index alone on PostgreSQL.
+    """
+    CHAT = 'chat'
+    IMAGE = 'image'
+    KIND_CHOICES = [(CHAT, 'Chat'), (IMAGE, 'Image')]
+    SAFE = 'safe'
+    FLAGGED = 'flagged'
+    VERDICT_CHOICES = [(SAFE, 'Safe'), (FLAGGED, 'Flagged')]
+
+    # Columns returned by the history API.
+    LISTED_FIELDS = ('id', 'kind', 'verdict', 'confidence', 'indicators', 'created_at')
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    verdict = models.CharField(max_length=10, choices=VERDICT_CHOICES)
+    confidence = models.FloatField(null=True, blank=True)
+    indicators = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', '-created_at', '-id'],
+                include=['kind', 'verdict', 'confidence', 'indicators'],
+                name='api_scanrecord_history_idx',
+            ),
+            models.Index(
+                fields=['user', 'verdict', '-created_at', '-id'],
+                include=['kind', 'confidence', 'indicators'],
+                name='api_scanrecord_verdict_idx',
+            ),
+        ]
@@ -0,0 +1,31 @@
+"""
+Fast JSON parser, backed by orjson when it is installed.
+"""
+import io
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+from .renderers import FastJSONRenderer, orjson
+
+
+class FastJSONParser(JSONParser):
+    """
+    Drop-in replacement for ``JSONParser``. UTF-8 bodies are decoded with
+    orjson; anything it rejects is re-parsed by the stock parser so error
+    messages are unchanged. Unlike the stdlib, orjson decodes integers wider
+    than 64 bits as floats; no endpoint accepts such numbers.
+    """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return super().parse(io.BytesIO(body), media_type, parser_context)
@@ -0,0 +1,124 @@
+"""
+Fast JSON and streaming NDJSON renderers.
+
+``FastJSONRenderer`` produces the same bytes as DRF's ``JSONRenderer`` for
+compact, UTF-8 output, using ``orjson`` when it is installed and the
+standard library otherwise. Anything orjson cannot encode identically
+(non-string keys, integers wider than 64 bits, indented output) is handed to
+the stock renderer. One known difference remains: floats whose ``repr``
+uses exponent notation (magnitudes below 1e-4 or from 1e16) are written in
+orjson's format, so endpoints round floats before rendering. orjson also
+writes NaN and infinities as ``null`` where the stock renderer raises
+``ValueError``; data is not walked in Python to look for them, as that
+costs more than the encoding itself, so the code producing floats for a
+response keeps them finite (see ``api.utils.classifier``).
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised when orjson is absent
+    orjson = None
+
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME if orjson else 0
+
+# Sentinel for an exhausted iterator.
+_DONE = object()
+
+LINE_SEPARATOR = '\u2028'.encode()
+PARAGRAPH_SEPARATOR = '\u2029'.encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Drop-in replacement for ``JSONRenderer`` backed by orjson when available.
+    """
+    def __init__(self):
+        # DRF's encoder handles the types orjson passes back to us, such as
+        # datetimes (formatted the DRF way), Decimals and lazy strings.
+        self._default = self.encoder_class().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self._default, option=ORJSON_OPTIONS)
+        except TypeError:
+            # orjson.JSONEncodeError subclasses TypeError; let the stock
+            # renderer produce the output (or the error) it always has.
+            return super().render(data, accepted_media_type, renderer_context)
+        # Match JSONRenderer, which escapes these to stay a JavaScript subset.
+        if LINE_SEPARATOR in ret or PARAGRAPH_SEPARATOR in ret:
+            ret = ret.replace(LINE_SEPARATOR, b'\\u2028').replace(PARAGRAPH_SEPARATOR, b'\\u2029')
+        return ret
+
+
+def dumps(data):
+    """
+    Encode ``data`` as compact JSON bytes without a trailing newline.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=encoders.JSONEncoder().default, option=ORJSON_OPTIONS)
+        except TypeError:
+            pass
+    return json.dumps(data, cls=encoders.JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Newline-delimited JSON: one compact JSON document per line.
+
+    A list is rendered as one line per item. For large result sets use
+    ``NDJSONStreamingResponse`` so the output is produced line by line and
+    never held in memory as a whole.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        items = data if isinstance(data, (list, tuple)) else [data]
+        return b''.join(self.iter_lines(items))
+
+    @staticmethod
+    def iter_lines(items):
+        for item in items:
+            yield dumps(item) + b'\n'
+
+
+class NDJSONStreamingResponse(StreamingHttpResponse):
+    """
+    Stream an iterable of JSON-serialisable items as NDJSON.
+
+    Under ASGI, Django collects a synchronous iterator with
+    ``sync_to_async(list)`` before sending anything. Here each line is
+    pulled in the request's sync thread as it is needed, so lines go out as
+    soon as they are produced under ASGI as well as WSGI.
+    """
+    def __init__(self, items, **kwargs):
+        kwargs.setdefault('content_type', NDJSONRenderer.media_type)
+        super().__init__(NDJSONRenderer.iter_lines(items), **kwargs)
+
+    async def __aiter__(self):
+        if self.is_async:
+            async for part in super().__aiter__():
+                yield part
+            return
+        lines = iter(self.streaming_content)
+        pull = sync_to_async(next)
+        while (line := await pull(lines, _DONE)) is not _DONE:
+            yield line
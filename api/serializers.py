@@ -1,22 +1,54 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
+from contextlib import nullcontext
+from django.db import IntegrityError, connection, transaction
+from .models import EMAIL_UNIQUE_SUFFIX
 
 User = get_user_model()
 
+
+def violates_unique_username(error):
+    """
+    Whether an IntegrityError comes from the username unique constraint:
+    ``auth_user.username`` on SQLite and MySQL, ``auth_user_username_key``
+    on PostgreSQL.
+    """
+    table = User._meta.db_table
+    message = str(error)
+    return f'{table}.username' in message or f'{table}_username_key' in message
+
+
 class SignUpSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, validators=[validate_password])
 
     class Meta:
         model = User
         fields = ['username', 'email', 'password']
+        # Uniqueness is enforced by the database in create(), not by a
+        # pre-check query that concurrent signups could race past.
+        extra_kwargs = {
+            'username': {'validators': [User.username_validator]},
+            'email': {'required': True, 'allow_blank': False},
+        }
 
     def create(self, validated_data):
-        user = User.objects.create_user(
-            username=validated_data['username'],
-            email=validated_data['email'],
-            password=validated_data['password']
-        )
+        # In autocommit mode the INSERT is its own transaction; only add a
+        # savepoint when an outer transaction must survive the IntegrityError.
+        guard = transaction.atomic() if connection.in_atomic_block else nullcontext()
+        try:
+            with guard:
+                user = User.objects.create_user(
+                    username=validated_data['username'],
+                    email=validated_data['email'],
+                    password=validated_data['password']
+                )
+        except IntegrityError as e:
+            if EMAIL_UNIQUE_SUFFIX in str(e):
+                raise serializers.ValidationError({'email': ['A user with that email already exists.']})
+            if violates_unique_username(e):
+                raise serializers.ValidationError({'username': [User._meta.get_field('username').error_messages['unique']]})
+            raise
         return user
 
 class LoginSerializer(serializers.Serializer):
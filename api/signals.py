@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import ScanRule
+from .utils.scanner import bump_rules_version
+
+
+@receiver([post_save, post_delete], sender=ScanRule)
+def scan_rules_changed(sender, **kwargs):
+    bump_rules_version()
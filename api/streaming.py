@@ -0,0 +1,145 @@
+"""
+Real-time chat monitoring over WebSocket.
+
+Clients connect to ``/ws/chat-monitor/?token=<access token>`` and send one
+JSON frame per chat message::
+
+    {"conversation_id": "abc", "message": "hey, send me"}
+
+Each message is scanned exactly once against the conversation's
+``IncrementalScanner`` state, and any indicators it completes are pushed
+back immediately. Conversation state lives in a per-process LRU with an
+idle timeout, so memory stays bounded however many conversations are open.
+"""
+import json
+import logging
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .utils.scanner import IncrementalScanner, ShardsNotLoaded, rulesets
+
+logger = logging.getLogger(__name__)
+
+CHAT_MONITOR_PATH = '/ws/chat-monitor/'
+
+# Application-defined WebSocket close codes (4000-4999).
+CLOSE_UNAUTHORIZED = 4401
+MAX_MESSAGE_LENGTH = 10_000
+
+
+class ConversationStore:
+    """
+    LRU of per-conversation scanner state with idle eviction.
+
+    Entries are kept in least-recently-used order, so expired ones are always
+    at the front and eviction is amortised O(1) per access.
+    """
+    def __init__(self, max_conversations, idle_seconds):
+        self.max_conversations = max_conversations
+        self.idle_seconds = idle_seconds
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        self.evict(now)
+        entry = self._entries.pop(key, None)
+        scanner = entry[0] if entry is not None else IncrementalScanner()
+        self._entries[key] = (scanner, now)
+        while len(self._entries) > self.max_conversations:
+            self._entries.popitem(last=False)
+        return scanner
+
+    def evict(self, now):
+        while self._entries:
+            key, (_, last_seen) = next(iter(self._entries.items()))
+            if now - last_seen < self.idle_seconds:
+                break
+            del self._entries[key]
+
+
+conversations = ConversationStore(
+    max_conversations=getattr(settings, 'KITO_STREAM_MAX_CONVERSATIONS', 10_000),
+    idle_seconds=getattr(settings, 'KITO_STREAM_IDLE_SECONDS', 900),
+)
+
+
+def authenticate(scope):
+    """
+    Return the user id from the ``token`` query parameter, or ``None``.
+    Only the signature and expiry are checked, so no database query is made.
+    """
+    query = parse_qs(scope.get('query_string', b'').decode())
+    token = (query.get('token') or [None])[0]
+    if not token:
+        return None
+    try:
+        return AccessToken(token)[jwt_settings.USER_ID_CLAIM]
+    except (TokenError, KeyError):
+        return None
+
+
+async def handle_frame(user_id, text):
+    try:
+        payload = json.loads(text)
+        conversation_id = str(payload['conversation_id'])
+        message = payload['message']
+    except (ValueError, TypeError, KeyError):
+        return {'status': 'error', 'error': 'Expected {"conversation_id": ..., "message": ...}'}
+    if not isinstance(message, str) or len(message) > MAX_MESSAGE_LENGTH:
+        return {'status': 'error', 'error': 'message must be a string of at most %d characters' % MAX_MESSAGE_LENGTH}
+
+    scanner = conversations.get((user_id, conversation_id))
+    loaded = {}
+    while True:
+        try:
+            matches = scanner.feed(message, lambda locales: rulesets.cached(locales) or loaded.get(tuple(locales)))
+            break
+        except ShardsNotLoaded as exc:
+            # Compiling a shard queries the database, which must not run on the
+            # loop. Another socket on this conversation may add locales during
+            # the await, so the loaded shards are only used for these locales.
+            loaded[tuple(exc.locales)] = await sync_to_async(rulesets.get)(exc.locales)
+    return {
+        'status': 'success',
+        'conversation_id': conversation_id,
+        'kito_indicators': [match['indicator'] for match in matches],
+        'matches': matches,
+        'message': 'Potential threat detected' if matches else 'Safe message',
+    }
+
+
+async def chat_monitor_app(scope, receive, send):
+    """
+    ASGI application for the chat monitor WebSocket.
+    """
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+
+    user_id = authenticate(scope)
+    if user_id is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+        return
+    await send({'type': 'websocket.accept'})
+
+    while True:
+        event = await receive()
+        if event['type'] == 'websocket.disconnect':
+            return
+        if event['type'] != 'websocket.receive':
+            continue
+        text = event.get('text')
+        if text is None and event.get('bytes') is not None:
+            text = event['bytes'].decode('utf-8', 'replace')
+        response = await handle_frame(user_id, text or '')
+        await send({'type': 'websocket.send', 'text': json.dumps(response)})
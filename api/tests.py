@@ -1,9 +1,12 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth.models import User
 from rest_framework.test import APIClient
 from rest_framework import status
+import io
 import json
+import os
 
 class AuthenticationTests(TestCase):
     def setUp(self):
@@ -226,4 +229,1065 @@ class KitoProtectionTests(TestCase):
         # In a real test, you would upload an actual image file
         # This is just a placeholder for the test
         response = self.client.post(self.scan_image_safety_url, format='multipart')
-        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class ChatScanConfidenceTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.chat_scan_url = reverse('chat-scan')
+
+    def test_single_transcript_has_confidence(self):
+        """Test that a single scan returns a calibrated confidence"""
+        response = self.client.post(self.chat_scan_url, {'transcript': 'Hey baby, send me money now.'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['kito_indicators'], ['send me money'])
+        self.assertGreater(response.data['confidence'], 0.5)
+
+    def test_batch_transcripts(self):
+        """Test scoring several transcripts in one request"""
+        data = {'transcripts': ['Send me money for transport, come alone', 'How was your day at work?']}
+        response = self.client.post(self.chat_scan_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        risky, safe = response.data['results']
+        self.assertGreater(risky['confidence'], safe['confidence'])
+        self.assertTrue(0.0 <= safe['confidence'] <= 1.0)
+
+    def test_confidence_scores_the_normalised_text(self):
+        """Test that obfuscation does not change the confidence the matcher's text gets"""
+        from .utils.classifier import score_transcripts
+        obfuscated, plain, spaced = score_transcripts(['S3nd me m0ney!', 'send me money!', 's e n d me money'])
+        self.assertEqual(obfuscated, plain)
+        self.assertGreater(obfuscated, spaced)
+
+    def test_calibration_uses_held_out_scores(self):
+        """Test that Platt scaling is not fitted on the training scores"""
+        import numpy as np
+        from .utils.classifier import HashedNgramClassifier, _fit_platt, load_seed_corpus
+        texts, labels = load_seed_corpus()
+        model = HashedNgramClassifier.fit(texts, labels)
+        in_sample = _fit_platt(model.decision_function(texts), np.asarray(labels))
+        self.assertNotAlmostEqual(model.calibration[0], in_sample[0], places=3)
+
+    def test_batch_rejects_non_strings(self):
+        """Test that malformed batches are rejected"""
+        response = self.client.post(self.chat_scan_url, {'transcripts': [1, 2]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(KITO_CHAT_MAX_TRANSCRIPT_LENGTH=10)
+    def test_single_transcript_is_validated(self):
+        """Test that a non-string or oversized transcript is rejected like batch items"""
+        for data in ({'transcript': 5}, {'transcript': ['send me money']}, {'transcript': None},
+                     {'transcript': 'x' * 11}, {'transcripts': ['x' * 11]}):
+            response = self.client.post(self.chat_scan_url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, data)
+        response = self.client.post(self.chat_scan_url, {'transcript': 'x' * 10}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_batch_of_thousand_is_fast(self):
+        """Test that a batch of 1,000 transcripts scores well under a second"""
+        from time import perf_counter
+        from .utils.classifier import score_transcripts
+        transcripts = ['Hey, how are you? Please send me money for transport now now'] * 1000
+        score_transcripts(transcripts[:1])
+        start = perf_counter()
+        scores = score_transcripts(transcripts)
+        self.assertEqual(len(scores), 1000)
+        self.assertLess(perf_counter() - start, 0.5)
+
+
+class ScanArtifactTests(TestCase):
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(KITO_ARTIFACT_DIR=self.tmpdir.name, KITO_ARTIFACT_RELOAD_INTERVAL=0)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmpdir.cleanup()
+
+    def test_round_trip_is_memory_mapped(self):
+        """Test that artifact arrays are read-only views over the file"""
+        import numpy as np
+        from .utils.artifacts import artifact_store, write_artifact
+        weights = np.arange(10, dtype=np.float32)
+        write_artifact(artifact_store.path_for('example'), {'weights': weights}, kind='example', meta={'bias': 1.5})
+        artifact = artifact_store.get('example')
+        np.testing.assert_array_equal(artifact['weights'], weights)
+        self.assertFalse(artifact['weights'].flags.writeable)
+        self.assertEqual(artifact.meta['bias'], 1.5)
+
+    def test_atomic_swap_is_picked_up(self):
+        """Test that republishing an artifact swaps it for new lookups"""
+        import numpy as np
+        from .utils.artifacts import artifact_store, write_artifact
+        path = artifact_store.path_for('example')
+        write_artifact(path, {'weights': np.zeros(4, dtype=np.float32)}, kind='example')
+        old = artifact_store.get('example')
+        write_artifact(path, {'weights': np.ones(4, dtype=np.float32)}, kind='example')
+        new = artifact_store.get('example')
+        self.assertIsNot(old, new)
+        self.assertEqual(float(old['weights'].sum()), 0.0)
+        self.assertEqual(float(new['weights'].sum()), 4.0)
+
+    def test_classifier_loads_from_artifact(self):
+        """Test that the published classifier matches the trained one"""
+        from .utils.artifacts import artifact_store
+        from .utils.classifier import ARTIFACT_NAME, HashedNgramClassifier, get_classifier, load_seed_corpus
+        model = HashedNgramClassifier.fit(*load_seed_corpus())
+        model.save(artifact_store.path_for(ARTIFACT_NAME))
+        loaded = get_classifier()
+        self.assertIsNot(loaded, model)
+        texts = ['send me money now', 'how was your day']
+        self.assertEqual(list(loaded.predict_proba(texts)), list(model.predict_proba(texts)))
+
+
+    def test_missing_or_corrupt_classifier_falls_back_to_seed_model(self):
+        """Test that chat scans keep their confidence without a usable classifier artifact"""
+        import numpy as np
+        from .utils.artifacts import artifact_store, write_artifact
+        from .utils.classifier import ARTIFACT_NAME, HashedNgramClassifier, load_seed_corpus
+        seed = HashedNgramClassifier.fit(*load_seed_corpus())
+        expected = round(float(seed.predict_proba(['send me money now'])[0]), 4)
+        path = artifact_store.path_for(ARTIFACT_NAME)
+
+        def scan():
+            response = APIClient().post(reverse('chat-scan'), {'transcript': 'send me money now'}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return response.data['confidence']
+
+        self.assertEqual(scan(), expected)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'KITOART\x00' + b'\xff' * 5)
+        with self.assertLogs('api.utils.artifacts', 'ERROR'):
+            self.assertEqual(scan(), expected)
+        self.assertIsNone(artifact_store.get(ARTIFACT_NAME))
+
+        weights = np.full(16, np.nan, dtype=np.float32)
+        write_artifact(path, {'weights': weights}, kind=ARTIFACT_NAME, meta={'bias': 0.0, 'calibration': [1.0, 0.0]})
+        with self.assertLogs('api.utils.classifier', 'ERROR'):
+            self.assertEqual(scan(), expected)
+
+
+class ChatNormalizationTests(TestCase):
+    def test_obfuscated_phrases_are_detected(self):
+        """Test leetspeak, homoglyphs, zero-width characters and spacing"""
+        from .utils.scanner import find_indicators
+        transcripts = [
+            'Pls S3ND ME M0NEY now',
+            's\u0435nd m\u0435 m\u043eney',
+            'send\u200b me   money',
+            '\uff33\uff25\uff2e\uff24 me money',
+            'urgent\n\ttransfer',
+        ]
+        for transcript in transcripts:
+            self.assertEqual(len(find_indicators(transcript)), 1, transcript)
+
+    def test_punctuation_leet_needs_alphanumeric_neighbours(self):
+        """Test that '!' and '|' fold inside words but not as punctuation"""
+        from .utils.normalize import normalize
+        self.assertEqual(normalize('send money!').text, 'send money!')
+        self.assertEqual(normalize('!urgent pay|').text, '!urgent pay|')
+        self.assertEqual(normalize('yes | no').text, 'yes | no')
+        self.assertEqual(normalize('b!tco|n w!n!').text, 'bitcoln win!')
+
+    def test_offsets_map_back_to_original(self):
+        """Test that match spans point at the original characters"""
+        from .utils.scanner import find_indicators
+        transcript = 'ok so  s3nd\u200b  me   m0ney pls'
+        match, = find_indicators(transcript)
+        self.assertEqual(transcript[match['start']:match['end']], 's3nd\u200b  me   m0ney')
+
+    def test_chat_scan_reports_matches(self):
+        """Test that the chat scan endpoint uses the normalised matcher"""
+        response = APIClient().post(reverse('chat-scan'), {'transcript': 'be my $ugar d4ddy'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['kito_indicators'], ['sugar daddy'])
+        self.assertEqual(response.data['matches'][0]['start'], 6)
+
+
+class ChatMonitorStreamTests(TestCase):
+    def run_session(self, query_string, frames):
+        """Drive the WebSocket app with the given frames and collect what it sends"""
+        import asyncio
+        from asgiref.sync import async_to_sync
+        from .streaming import chat_monitor_app
+
+        async def session():
+            inbox = asyncio.Queue()
+            sent = []
+            await inbox.put({'type': 'websocket.connect'})
+            for frame in frames:
+                await inbox.put({'type': 'websocket.receive', 'text': json.dumps(frame)})
+            await inbox.put({'type': 'websocket.disconnect'})
+
+            async def send(event):
+                sent.append(event)
+
+            scope = {'type': 'websocket', 'path': '/ws/chat-monitor/', 'query_string': query_string}
+            await chat_monitor_app(scope, inbox.get, send)
+            return sent
+
+        return async_to_sync(session)()
+
+    def test_phrase_split_across_messages(self):
+        """Test that indicators spanning messages are pushed once completed"""
+        from rest_framework_simplejwt.tokens import AccessToken
+        user = User.objects.create_user(username='streamer', email='stream@example.com', password='testpassword123')
+        token = str(AccessToken.for_user(user))
+        frames = [
+            {'conversation_id': 'c1', 'message': 'hey, please send me'},
+            {'conversation_id': 'c1', 'message': 'm0ney now'},
+            {'conversation_id': 'c2', 'message': 'money'},
+        ]
+        sent = self.run_session(f'token={token}'.encode(), frames)
+        self.assertEqual(sent[0]['type'], 'websocket.accept')
+        replies = [json.loads(event['text']) for event in sent[1:]]
+        self.assertEqual(replies[0]['kito_indicators'], [])
+        self.assertEqual(replies[1]['kito_indicators'], ['send me money'])
+        self.assertTrue(replies[1]['matches'][0]['carried_over'])
+        self.assertEqual(replies[2]['kito_indicators'], [])
+
+    def test_rejects_missing_token(self):
+        """Test that unauthenticated sockets are closed"""
+        sent = self.run_session(b'', [])
+        self.assertEqual(sent, [{'type': 'websocket.close', 'code': 4401}])
+
+    @override_settings(KITO_RULES_RELOAD_INTERVAL=0)
+    def test_locales_added_while_loading_shards(self):
+        """Test that shards loaded for one locale set are not used for another"""
+        from unittest import mock
+        from asgiref.sync import async_to_sync
+        from .streaming import conversations, handle_frame
+        from .utils.scanner import rulesets
+        rulesets.clear()
+        scanner = conversations.get(('racer', 'c1'))
+        load = rulesets.get
+
+        def load_while_another_socket_adds_hausa(locales):
+            # What a concurrent frame on the same conversation would do.
+            scanner.locales = scanner.locales | {'ha'}
+            return load(locales)
+
+        with mock.patch.object(rulesets, 'get', side_effect=load_while_another_socket_adds_hausa):
+            reply = async_to_sync(handle_frame)('racer', json.dumps({'conversation_id': 'c1', 'message': 'abeg send money'}))
+        self.assertEqual(reply['kito_indicators'], ['abeg send money'])
+        self.assertEqual(set(scanner.states), {'', 'en', 'ha', 'pcm'})
+        for locale, (ruleset, _) in scanner.states.items():
+            self.assertIs(ruleset, rulesets.cached([locale])[0], locale)
+        rulesets.clear()
+
+    def test_idle_conversations_are_evicted(self):
+        """Test bounded conversation state"""
+        from .streaming import ConversationStore
+        store = ConversationStore(max_conversations=2, idle_seconds=10)
+        first = store.get('a', now=0)
+        store.get('b', now=1)
+        store.get('c', now=2)
+        self.assertEqual(len(store), 2)
+        self.assertIsNot(store.get('a', now=3), first)
+        store.get('d', now=20)
+        self.assertEqual(len(store), 1)
+
+
+@override_settings(KITO_RULES_RELOAD_INTERVAL=0)
+class ScanRuleTests(TestCase):
+    def tearDown(self):
+        from .utils.scanner import rulesets
+        # Rolled-back rules must not leak into other tests via the process cache.
+        rulesets.clear()
+
+    def test_moderator_regex_is_used_by_scan(self):
+        """Test that saving a rule makes the scan endpoint report it"""
+        from .models import ScanRule
+        ScanRule.objects.create(indicator='phone number', pattern=r'\b\d{4} ?\d{3} ?\d{4}\b', kind=ScanRule.REGEX)
+        transcript = 'call me on 0801 234 5678 pls'
+        response = APIClient().post(reverse('chat-scan'), {'transcript': transcript}, format='json')
+        self.assertEqual(response.data['kito_indicators'], ['phone number'])
+        match = response.data['matches'][0]
+        self.assertEqual(transcript[match['start']:match['end']], '0801 234 5678')
+
+    def test_unsupported_patterns_are_rejected(self):
+        """Test that lookbehinds, empty matches and huge repeats fail validation"""
+        from django.core.exceptions import ValidationError
+        from .models import ScanRule
+        for pattern in ['(?<=a)b', 'x*', 'a{1000}', '(unclosed', 'a++', '(a|b)*(?!b)', '(?!b)c?', '(a*)\\1?']:
+            with self.assertRaises(ValidationError, msg=pattern):
+                ScanRule(indicator='bad', pattern=pattern, kind=ScanRule.REGEX).full_clean()
+        for pattern in [r'(a*)\1b', r'(?=pay)\w+', r'(a|b)\1']:
+            ScanRule(indicator='ok', pattern=pattern, kind=ScanRule.REGEX).full_clean()
+
+    def test_catastrophic_pattern_runs_in_linear_time(self):
+        """Test that a classic ReDoS pattern cannot stall a scan"""
+        import time
+        from .utils.rules import RuleSet, compile_rule
+        ruleset = RuleSet([compile_rule('evil', '(a+)+$')])
+        started = time.monotonic()
+        self.assertEqual(ruleset.scan('a' * 20000 + '!')[1], [])
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual([hit[1:] for hit in ruleset.scan('xaaa')[1]], [(1, 4)])
+
+    def test_backreferences_match_long_spans(self):
+        """Test that backtracking rules are limited by their step budget only"""
+        from .utils.rules import RuleSet, compile_rule
+        echo = compile_rule('echo', r'\b(\w+) \1\b')
+        account = compile_rule('account', r'account (\d+) .* \1')
+        ruleset = RuleSet([echo, account, compile_rule('ahead', r'pay(?= now)')])
+        self.assertEqual([hit[1:] for hit in ruleset.scan('pay pay now')[1]], [(0, 7), (4, 7)])
+        word = 'a' * 1200
+        self.assertEqual(ruleset.scan(f'{word} {word}')[1], [(echo, 0, 2401)])
+        transcript = 'account 0123456789 ' + ' '.join(f'w{i}' for i in range(250)) + ' resend to 0123456789'
+        self.assertEqual(ruleset.scan(transcript)[1], [(account, 0, len(transcript))])
+
+    def test_exhausted_rule_does_not_skip_the_rest(self):
+        """Test that a rule running out of steps is skipped without starving later rules"""
+        from .utils.rules import RuleSet, compile_rule
+        greedy = compile_rule('greedy', r'(a|aa)+\1b')
+        echo = compile_rule('echo', r'(pay) \1')
+        with self.assertLogs('api.utils.rules', 'WARNING'):
+            hits = RuleSet([greedy, echo]).scan('a' * 40 + ' pay pay')[1]
+        self.assertEqual(hits, [(echo, 41, 48)])
+
+    def test_regex_spanning_messages(self):
+        """Test that the carried automaton state completes matches in later messages"""
+        from .models import ScanRule
+        from .utils.scanner import IncrementalScanner
+        ScanRule.objects.create(indicator='account number', pattern=r'acc(oun)?t\W+\d{10}', kind=ScanRule.REGEX)
+        scanner = IncrementalScanner()
+        self.assertEqual(scanner.feed('my acct'), [])
+        match, = scanner.feed('0123456789')
+        self.assertTrue(match['carried_over'])
+        self.assertEqual((match['start'], match['end']), (0, 10))
+
+
+@override_settings(KITO_RULES_RELOAD_INTERVAL=0, KITO_DEFAULT_LOCALES=['en'])
+class LocaleShardTests(TestCase):
+    def setUp(self):
+        from .utils.scanner import rulesets
+        rulesets.clear()
+
+    def test_detects_locale_and_loads_only_its_shard(self):
+        """Test that a Pidgin transcript compiles the Pidgin shard and nothing else"""
+        from .utils.scanner import rulesets, scan_transcript
+        matches, locales = scan_transcript('Abeg send money, no tell your mama o')
+        self.assertEqual(locales, ['en', 'pcm'])
+        self.assertEqual([m['indicator'] for m in matches], ['abeg send money', 'no tell your mama'])
+        self.assertEqual(set(rulesets.shards), {'', 'en', 'pcm'})
+
+    def test_script_detection_and_diacritics(self):
+        """Test Yoruba detection from dot-below letters and diacritic-insensitive phrases"""
+        from .utils.scanner import scan_transcript
+        matches, locales = scan_transcript('Ẹ jọwọ, fi owo ranse si mi')
+        self.assertIn('yo', locales)
+        self.assertEqual([m['indicator'] for m in matches], ['fi owó ránṣẹ́ sí mi'])
+
+    def test_unaccented_yoruba_is_detected(self):
+        """Test that Yoruba typed without diacritics still selects and matches the Yoruba shard"""
+        from .utils.scanner import scan_transcript
+        matches, locales = scan_transcript('fi owo ranse si mi')
+        self.assertEqual(locales, ['en', 'yo'])
+        self.assertEqual([m['indicator'] for m in matches], ['fi owó ránṣẹ́ sí mi'])
+        matches, locales = scan_transcript('ma so fun enikeni')
+        self.assertEqual([m['indicator'] for m in matches], ['má sọ fún ẹnikẹ́ni'])
+
+    def test_short_words_do_not_select_a_locale(self):
+        """Test that two-letter words shared with English don't trigger the Yoruba shard"""
+        from .utils.locales import detect_locales
+        self.assertEqual(detect_locales('ni mi ti amo', 'ni mi ti amo'), set())
+        self.assertEqual(detect_locales('bawo ni', 'bawo ni'), {'yo'})
+
+    def test_locale_hint_and_rule_locale(self):
+        """Test the locale request field and per-locale moderator rules"""
+        from .models import ScanRule
+        ScanRule.objects.create(indicator='hausa gift', pattern='kyauta', locale='ha')
+        client = APIClient()
+        response = client.post(reverse('chat-scan'), {'transcript': 'kyauta', 'locale': 'ha'}, format='json')
+        self.assertEqual(response.data['locales'], ['en', 'ha'])
+        self.assertEqual(response.data['kito_indicators'], ['hausa gift'])
+        response = client.post(reverse('chat-scan'), {'transcript': 'kyauta'}, format='json')
+        self.assertEqual(response.data['kito_indicators'], [])
+        response = client.post(reverse('chat-scan'), {'transcript': 'hi', 'locale': 'xx'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(KITO_SCAN_DAILY_QUOTA=3, KITO_USAGE_FLUSH_INTERVAL=0)
+class ScanQuotaTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(username='quota', email='quota@example.com', password='testpassword123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def scan(self, **data):
+        return self.client.post(reverse('chat-scan'), data or {'transcript': 'hello'}, format='json')
+
+    def test_quota_is_enforced_and_refunded(self):
+        """Test that batches count per item and rejected requests are not charged"""
+        from django.utils import timezone
+        from .usage import usage, usage_key
+        self.assertEqual(self.scan(transcripts=['a', 'b']).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.scan(transcripts=['c', 'd']).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(self.scan().status_code, status.HTTP_200_OK)
+        response = self.scan()
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+        from django.core.cache import cache
+        self.assertEqual(cache.get(usage_key(self.user.pk, timezone.localdate())), 3)
+        usage.flush()
+
+    def test_flush_and_reseed_after_cache_loss(self):
+        """Test the write-behind flush and reconciliation from the usage table"""
+        from django.core.cache import cache
+        from django.utils import timezone
+        from .models import ScanUsage
+        from .usage import usage
+        self.scan()
+        self.scan()
+        self.assertEqual(usage.flush(), 1)
+        self.assertEqual(ScanUsage.objects.get(user=self.user, day=timezone.localdate()).scans, 2)
+        # A stale flush must not lower the stored count.
+        ScanUsage.objects.filter(user=self.user).update(scans=5)
+        usage.add(self.user.pk, timezone.localdate(), 0)
+        usage.flush()
+        self.assertEqual(ScanUsage.objects.get(user=self.user).scans, 5)
+        cache.clear()
+        self.assertEqual(self.scan().status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        usage.flush()
+
+
+class ScanHistoryTests(TestCase):
+    def setUp(self):
+        from .models import ScanRecord
+        self.user = User.objects.create_user(username='history', email='history@example.com', password='testpassword123')
+        other = User.objects.create_user(username='other', email='other@example.com', password='testpassword123')
+        ScanRecord.objects.bulk_create(
+            [ScanRecord(user=self.user, kind='chat', verdict='flagged' if i % 3 == 0 else 'safe') for i in range(25)]
+            + [ScanRecord(user=other, kind='chat', verdict='flagged')]
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        from .usage import usage
+        # Write usage behind while the test database still exists.
+        usage.flush()
+
+    def test_keyset_pages_cover_history_once(self):
+        """Test that following next links returns every record once, newest first"""
+        url = reverse('scan-history') + '?page_size=10'
+        seen = []
+        pages = 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+            pages += 1
+        self.assertEqual(pages, 3)
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_verdict_filter_and_recording(self):
+        """Test verdict filtering and that authenticated scans are recorded"""
+        response = self.client.get(reverse('scan-history'), {'verdict': 'flagged'})
+        self.assertEqual(len(response.data['results']), 9)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'kind', 'verdict', 'confidence', 'indicators', 'created_at'})
+        self.client.post(reverse('chat-scan'), {'transcript': 'send me money'}, format='json')
+        latest = self.client.get(reverse('scan-history')).data['results'][0]
+        self.assertEqual((latest['verdict'], latest['indicators']), ('flagged', ['send me money']))
+        self.assertEqual(self.client.get(reverse('scan-history'), {'cursor': 'bogus'}).status_code, 404)
+
+    def test_placeholder_image_scan_is_not_recorded(self):
+        """Test that an image scan without an archive adds no verdict to the history"""
+        from .models import ScanRecord
+        response = self.client.post(reverse('image-scan'), format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(ScanRecord.objects.filter(user=self.user, kind=ScanRecord.IMAGE).exists())
+
+
+@override_settings(KITO_IMAGE_WORKERS=0)
+class ArchiveScanTests(TestCase):
+    @staticmethod
+    def make_archive(members):
+        import io
+        import zipfile
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name, data in members.items():
+                archive.writestr(name, data)
+        buffer.seek(0)
+        buffer.name = 'evidence.zip'
+        return buffer
+
+    @staticmethod
+    def png(size=(8, 6)):
+        import io
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (200, 30, 30)).save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    def scan(self, archive):
+        return APIClient().post(reverse('image-scan'), {'archive': archive}, format='multipart')
+
+    def test_streams_one_line_per_image(self):
+        """Test NDJSON results in archive order, with bad members reported inline"""
+        archive = self.make_archive({
+            'one.png': self.png(),
+            'notes.txt': b'not an image',
+            'broken.jpg': b'\xff\xd8 garbage',
+            'two.png': self.png((3, 4)),
+        })
+        response = self.scan(archive)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([line.get('name') for line in lines[:-1]], ['one.png', 'broken.jpg', 'two.png'])
+        self.assertEqual((lines[0]['width'], lines[0]['height']), (8, 6))
+        self.assertEqual(lines[0]['features']['flat_ratio'], 1.0)
+        self.assertEqual(lines[1]['status'], 'error')
+        self.assertEqual(lines[-1], {'summary': {'images': 3, 'success': 2, 'error': 1}})
+
+    def test_central_directory_is_parsed_once(self):
+        """Test that the quota throttle and the view share one parsed archive"""
+        from unittest import mock
+        from . import views
+        with mock.patch.object(views, 'open_archive', wraps=views.open_archive) as opened:
+            response = self.scan(self.make_archive({'a.png': self.png(), 'b.png': self.png()}))
+            b''.join(response.streaming_content)
+        self.assertEqual(opened.call_count, 1)
+
+    @override_settings(KITO_IMAGE_BATCH_SIZE=1)
+    def test_results_stream_through_asgi(self):
+        """Test that the deployed ASGI app sends lines before the scan finishes"""
+        import asyncio
+        from unittest import mock
+        from asgiref.sync import async_to_sync
+        from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+        from kitodeck.asgi import application
+        from .utils import archives
+
+        body = encode_multipart(BOUNDARY, {'archive': self.make_archive({f'{i}.png': self.png() for i in range(6)})})
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+            'scheme': 'http', 'path': reverse('image-scan'), 'raw_path': reverse('image-scan').encode(),
+            'query_string': b'', 'root_path': '', 'server': ('testserver', 80), 'client': ('127.0.0.1', 1234),
+            'headers': [(b'host', b'testserver'), (b'content-type', MULTIPART_CONTENT.encode()),
+                        (b'content-length', str(len(body)).encode())],
+        }
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await asyncio.Event().wait()
+
+        lines = []
+
+        async def send(message):
+            if message['type'] == 'http.response.body' and message.get('body'):
+                lines.append((json.loads(message['body']), analyzed.call_count))
+
+        with mock.patch.object(archives, 'analyze_images', wraps=archives.analyze_images) as analyzed:
+            async_to_sync(application)(scope, receive, send)
+        self.assertEqual(len(lines), 7)
+        self.assertEqual(lines[-1][0]['summary']['success'], 6)
+        # The first line went out while most images were still unscanned.
+        self.assertLess(lines[0][1], 6)
+
+    @override_settings(KITO_ARCHIVE_MAX_MEMBER_BYTES=1024 * 1024)
+    def test_rejects_zip_bombs_before_decompressing(self):
+        """Test declared-size and compression-ratio limits"""
+        response = self.scan(self.make_archive({'bomb.png': bytes(2 * 1024 * 1024)}))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.scan(self.make_archive({'ratio.png': bytes(512 * 1024)}))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('compression ratio', response.data['error'])
+        not_a_zip = SimpleUploadedFile('evidence.zip', b'PK not really')
+        self.assertEqual(self.scan(not_a_zip).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_actual_size_is_enforced(self):
+        """Test that a member producing more than its declared size aborts the scan"""
+        import zipfile
+        from .utils.archives import ArchiveError, read_member
+        archive = zipfile.ZipFile(self.make_archive({'a.png': self.png()}))
+        info = archive.infolist()[0]
+        with self.assertRaises(ArchiveError):
+            read_member(archive, info, budget=10)
+
+    @override_settings(KITO_IMAGE_WORKERS=1)
+    def test_process_pool(self):
+        """Test that images decode in the worker pool"""
+        from .utils.archives import get_image_pool, open_archive, scan_archive
+        archive, members = open_archive(self.make_archive({f'{i}.png': self.png() for i in range(3)}))
+        results = list(scan_archive(archive, members, get_image_pool()))
+        self.assertEqual(results[-1]['summary']['success'], 3)
+
+
+class ImageFeatureTests(TestCase):
+    @staticmethod
+    def encode(image, image_format='PNG'):
+        import io
+        buffer = io.BytesIO()
+        image.save(buffer, format=image_format)
+        return buffer.getvalue()
+
+    def test_features_of_known_images(self):
+        """Test skin, flatness, colour and blur features on synthetic images"""
+        import numpy as np
+        from PIL import Image
+        from .utils.features import extract_features, to_batch
+        skin = Image.new('RGB', (300, 200), (224, 172, 150))
+        noise = Image.fromarray(np.random.default_rng(0).integers(0, 256, (200, 300, 3), dtype=np.uint8))
+        flat, noisy = extract_features(to_batch([skin, noise]))
+        self.assertEqual(flat['skin_ratio'], 1.0)
+        self.assertEqual(flat['flat_ratio'], 1.0)
+        self.assertEqual(flat['colours'], 1)
+        self.assertEqual(flat['blur'], 0.0)
+        self.assertLess(noisy['flat_ratio'], 0.1)
+        self.assertGreater(noisy['colours'], 16)
+        self.assertGreater(noisy['blur'], 1000)
+        # Batching does not change any image's features.
+        self.assertEqual(extract_features(to_batch([noise])), [noisy])
+
+    def test_batch_keeps_order_and_declared_size(self):
+        """Test that bad images don't shift results and draft decoding keeps the real size"""
+        from PIL import Image
+        from .utils.images import analyze_images
+        photo = self.encode(Image.new('RGB', (1600, 1200), (10, 120, 200)), 'JPEG')
+        results = analyze_images([('a.jpg', photo), ('b.png', b'junk'), ('c.png', self.encode(Image.new('L', (5, 5))))])
+        self.assertEqual([r['status'] for r in results], ['success', 'error', 'success'])
+        self.assertEqual((results[0]['width'], results[0]['height']), (1600, 1200))
+        self.assertNotIn('features', results[1])
+        self.assertEqual(results[2]['features']['colours'], 1)
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.client = APIClient()
+
+    def signup(self, key, **data):
+        data = {'username': 'retry', 'email': 'retry@example.com', 'password': 'quiet-harbour-1984', **data}
+        return self.client.post(reverse('signup'), data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retried_signup_is_replayed(self):
+        """Test that a retry gets the stored response without creating or emailing twice"""
+        from django.core import mail
+        first = self.signup('k1')
+        retry = self.signup('k1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertNotIn('Idempotent-Replayed', first)
+        self.assertEqual(User.objects.filter(username='retry').count(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        # A different payload under the same key is rejected.
+        self.assertEqual(self.signup('k1', username='other').status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        # Without a key nothing is replayed.
+        response = self.client.post(reverse('signup'), {'username': 'retry', 'email': 'retry@example.com', 'password': 'quiet-harbour-1984'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(KITO_ANON_SCAN_DAILY_QUOTA=1)
+    def test_replay_is_not_charged_and_keys_are_per_user(self):
+        """Test that replays skip the quota and keys do not leak across users"""
+        def scan(client, key):
+            return client.post(reverse('chat-scan'), {'transcript': 'hello'}, format='json', HTTP_IDEMPOTENCY_KEY=key)
+        self.assertEqual(scan(self.client, 'scan-1').status_code, status.HTTP_200_OK)
+        self.assertEqual(scan(self.client, 'scan-1')['Idempotent-Replayed'], 'true')
+        self.assertEqual(scan(self.client, 'scan-2').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        from .usage import usage
+        user_client = APIClient()
+        user_client.force_authenticate(User.objects.create_user(username='keyed', password='testpassword123'))
+        response = scan(user_client, 'scan-1')
+        usage.flush()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+    @override_settings(KITO_IMAGE_WORKERS=0)
+    def test_streamed_archive_scan_is_replayed(self):
+        """Test that NDJSON responses are stored once fully streamed"""
+        def scan():
+            archive = ArchiveScanTests.make_archive({'a.png': ArchiveScanTests.png()})
+            return self.client.post(reverse('image-scan'), {'archive': archive}, format='multipart', HTTP_IDEMPOTENCY_KEY='zip')
+        streamed = b''.join(scan().streaming_content)
+        replay = scan()
+        self.assertFalse(replay.streaming)
+        self.assertEqual(replay.content, streamed)
+        self.assertEqual(replay['Content-Type'], 'application/x-ndjson')
+
+    def test_oversized_stream_is_not_stored(self):
+        """Test that a stream over KITO_IDEMPOTENCY_MAX_BYTES is never replayed truncated"""
+        from django.core.cache import cache
+        from .idempotency import IdempotencyClaim
+        from .renderers import NDJSONStreamingResponse
+        claim = IdempotencyClaim('idempotency:test-overflow', 'fingerprint')
+        with self.settings(KITO_IDEMPOTENCY_MAX_BYTES=10):
+            response = claim.complete(NDJSONStreamingResponse([1234567, 2345678, 3456789]))
+            self.assertEqual(b''.join(response.streaming_content), b'1234567\n2345678\n3456789\n')
+        self.assertIsNone(cache.get(claim.cache_key))
+
+    def in_flight_claim(self, key, payload):
+        from rest_framework.parsers import JSONParser
+        from rest_framework.request import Request
+        from rest_framework.test import APIRequestFactory
+        from .idempotency import IdempotencyClaim, request_fingerprint
+        request = Request(APIRequestFactory().post(reverse('chat-scan'), payload, format='json'), parsers=[JSONParser()])
+        return IdempotencyClaim.acquire('anon', key, request_fingerprint(request))
+
+    def test_concurrent_duplicate_is_told_to_retry(self):
+        """Test that a duplicate of an in-flight request gets 409 at once, then the replay"""
+        import time
+        from django.http import JsonResponse
+        claim = self.in_flight_claim('busy', {'transcript': 'hello'})
+        post = lambda: self.client.post(reverse('chat-scan'), {'transcript': 'hello'}, format='json', HTTP_IDEMPOTENCY_KEY='busy')
+        start = time.monotonic()
+        response = post()
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response['Retry-After'], '1')
+
+        claim.complete(JsonResponse({'from': 'first request'}))
+        response = post()
+        self.assertEqual(response.json(), {'from': 'first request'})
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+
+    def test_stuck_request_is_taken_over_once_released(self):
+        """Test that a key can be claimed again once its holder gives up without a response"""
+        claim = self.in_flight_claim('stuck', {'transcript': 'hello'})
+        post = lambda: self.client.post(reverse('chat-scan'), {'transcript': 'hello'}, format='json', HTTP_IDEMPOTENCY_KEY='stuck')
+        self.assertEqual(post().status_code, status.HTTP_409_CONFLICT)
+        claim.release()
+        self.assertEqual(post().status_code, status.HTTP_200_OK)
+
+
+class BulkImportUsersTests(TestCase):
+    def test_imports_and_skips_duplicates(self):
+        """Test CSV import with in-file and existing duplicates"""
+        import tempfile
+        from django.core import mail
+        from django.core.management import call_command
+        User.objects.create_user(username='existing', email='taken@example.com', password='testpassword123')
+        rows = [
+            'username,email,password',
+            'alice,alice@example.com,alicepassword1',
+            'bob,bob@example.com,bobpassword1',
+            'bob,other@example.com,bobpassword2',
+            'carol,TAKEN@example.com,carolpassword1',
+            'dave,not-an-email,davepassword1',
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write('\n'.join(rows))
+        self.addCleanup(os.remove, f.name)
+        call_command('bulk_import_users', f.name, workers=2, chunk_size=2, send_welcome=True, stdout=io.StringIO())
+
+        alice = User.objects.get(username='alice')
+        self.assertTrue(alice.check_password('alicepassword1'))
+        self.assertTrue(User.objects.get(username='bob').check_password('bobpassword1'))
+        self.assertFalse(User.objects.filter(username__in=['carol', 'dave']).exists())
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['alice@example.com', 'bob@example.com'])
+
+    def test_skips_malformed_lines_and_invalid_usernames(self):
+        """Test that bad NDJSON lines and usernames are reported without aborting the import"""
+        import tempfile
+        from django.core.management import call_command
+        rows = [
+            json.dumps({'username': 'erin', 'email': 'erin@example.com', 'password': 'erinpassword1'}),
+            '{"username": "frank", "email": ',
+            '["not", "an", "object"]',
+            json.dumps({'username': 'bad name!', 'email': 'bad@example.com', 'password': 'badpassword1'}),
+            json.dumps({'username': 'gina', 'email': ' gina@example.com ', 'password': 'ginapassword1'}),
+            json.dumps({'username': 'hank', 'email': 5, 'password': 'hankpassword1'}),
+            json.dumps({'username': 'ivy', 'email': 'ivy@example.com', 'password': 12345678}),
+            json.dumps({'username': 'jo', 'email': 'jo@example.com', 'password': 'jopassword1', 'last_name': ['x']}),
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as f:
+            f.write('\n'.join(rows))
+        self.addCleanup(os.remove, f.name)
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('bulk_import_users', f.name, workers=1, stdout=stdout, stderr=stderr)
+
+        self.assertEqual(sorted(User.objects.values_list('username', flat=True)), ['erin', 'gina'])
+        self.assertIn('Line 2: malformed JSON', stderr.getvalue())
+        self.assertIn('Line 3: not a JSON object', stderr.getvalue())
+        self.assertEqual(User.objects.get(username='gina').email, 'gina@example.com')
+        self.assertIn('6 invalid rows', stdout.getvalue())
+
+
+class TokenLedgerTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='ledger', email='ledger@example.com', password='testpassword123')
+
+    def test_login_writes_only_ledger_entry(self):
+        """Test that ledger-mode login writes one compact row and no outstanding token"""
+        from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+        from .models import TokenLedgerEntry
+        data = {'email': 'ledger@example.com', 'password': 'testpassword123'}
+        with self.settings(KITO_TOKEN_LEDGER=True):
+            response = self.client.post(reverse('login'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(TokenLedgerEntry.objects.count(), 1)
+        self.assertEqual(OutstandingToken.objects.count(), 0)
+
+    def test_purge_deletes_expired_rows_in_batches(self):
+        """Test the scheduled purge and its metrics"""
+        from datetime import timedelta
+        from django.core.management import call_command
+        from django.utils import timezone
+        from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+        from .models import TokenLedgerEntry
+        from .utils.metrics import render_metrics
+        past = timezone.now() - timedelta(days=1)
+        future = timezone.now() + timedelta(days=1)
+        TokenLedgerEntry.objects.bulk_create(
+            [TokenLedgerEntry(jti=f'old{i}', user=self.user, expires_at=past) for i in range(5)]
+            + [TokenLedgerEntry(jti='fresh', user=self.user, expires_at=future)]
+        )
+        OutstandingToken.objects.create(user=self.user, jti='gone', token='x', expires_at=past)
+
+        call_command('purge_expired_tokens', batch_size=2, stdout=open(os.devnull, 'w'))
+
+        self.assertEqual(list(TokenLedgerEntry.objects.values_list('jti', flat=True)), ['fresh'])
+        self.assertFalse(OutstandingToken.objects.exists())
+        metrics = render_metrics()
+        self.assertIn('kitodeck_token_table_rows{table="token_ledger"} 1', metrics)
+        self.assertIn('kitodeck_token_purge_seconds{table="outstanding_token"}', metrics)
+
+
+class StatelessMiddlewareTests(TestCase):
+    def test_api_routes_skip_session_machinery(self):
+        """Test that API requests bypass session, auth and message middleware"""
+        from django.test import Client
+        response = Client(enforce_csrf_checks=True).post(
+            reverse('chat-scan'), {'transcript': 'hello'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(hasattr(response.wsgi_request, 'session'))
+        self.assertFalse(hasattr(response.wsgi_request, '_messages'))
+
+    def test_admin_keeps_session_and_csrf(self):
+        """Test that the admin still gets sessions and CSRF protection"""
+        from django.test import Client
+        client = Client(enforce_csrf_checks=True)
+        response = client.get('/admin/login/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(hasattr(response.wsgi_request, 'session'))
+        self.assertIn('csrftoken', response.cookies)
+        response = client.post('/admin/login/', {'username': 'x', 'password': 'y'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class SignUpConstraintTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        User.objects.create_user(username='taken', email='Taken@Example.com', password='testpassword123')
+
+    def signup(self, username, email):
+        data = {'username': username, 'email': email, 'password': 'Str0ng-passw0rd!'}
+        return self.client.post(reverse('signup'), data, format='json')
+
+    def test_duplicate_email_is_case_insensitive(self):
+        """Test that the database rejects an email differing only in case"""
+        response = self.signup('someone', 'taken@example.COM')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'email': ['A user with that email already exists.']})
+
+    def test_duplicate_username(self):
+        """Test that username conflicts map to the usual 400 response"""
+        response = self.signup('taken', 'new@example.com')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'username': ['A user with that username already exists.']})
+
+    def test_other_integrity_errors_are_not_reported_as_usernames(self):
+        """Test that only the username constraint maps to the username error"""
+        from unittest import mock
+        from django.db import IntegrityError
+        error = IntegrityError('NOT NULL constraint failed: auth_user.last_name')
+        with mock.patch.object(User.objects, 'create_user', side_effect=error):
+            with self.assertRaises(IntegrityError):
+                self.signup('someone', 'someone@example.com')
+
+    def test_migration_refuses_case_insensitive_duplicates(self):
+        """Test that the email constraint migration lists conflicting accounts"""
+        import importlib
+        from django.apps import apps
+        from django.db import connection
+        migration = importlib.import_module('api.migrations.0005_user_email_ci_unique')
+        migration.check_duplicate_emails(apps, connection.schema_editor())
+        with connection.cursor() as cursor:
+            # The live index already forbids this; drop it inside the test transaction.
+            cursor.execute(f'DROP INDEX {migration.index_name(User._meta.db_table)}')
+        twin = User.objects.create_user(username='twin', email='TAKEN@example.com', password='testpassword123')
+        with self.assertRaisesMessage(RuntimeError, f"id={twin.pk} username='twin' email='TAKEN@example.com'"):
+            migration.check_duplicate_emails(apps, connection.schema_editor())
+
+    def test_signup_skips_uniqueness_prechecks(self):
+        """Test that a successful signup issues the INSERT without SELECT pre-checks"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            response = self.signup('fresh', 'fresh@example.com')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        statements = [q['sql'].split()[0] for q in queries.captured_queries]
+        self.assertNotIn('SELECT', statements)
+
+    def test_login_email_is_case_insensitive(self):
+        """Test that login finds the user through the lower-cased email"""
+        data = {'email': 'TAKEN@example.com', 'password': 'testpassword123'}
+        response = self.client.post(reverse('login'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class FastJSONTests(TestCase):
+    payloads = [
+        {'status': 'success', 'kito_indicators': ['send me money'], 'confidence': 0.9446},
+        {'results': [{'confidence': 0.0, 'matches': []}, {'confidence': 1.0}], 'n': 10 ** 12},
+        {'unicode': 'naïve ✓ 👍', 'separators': 'a b c', 'escapes': '"\\\n\t'},
+        {1: 'non-string key', 'big': 2 ** 70},
+        None,
+    ]
+
+    def test_renderer_is_byte_compatible(self):
+        """Test that the fast renderer matches DRF's JSONRenderer byte for byte"""
+        import datetime
+        import decimal
+        import uuid
+        from rest_framework.renderers import JSONRenderer
+        from .renderers import FastJSONRenderer
+        payloads = self.payloads + [{
+            'when': datetime.datetime(2025, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc),
+            'day': datetime.date(2025, 1, 2),
+            'amount': decimal.Decimal('1.50'),
+            'id': uuid.UUID(int=1),
+        }]
+        for data in payloads:
+            self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data), data)
+        self.assertEqual(
+            FastJSONRenderer().render({'a': 1}, 'application/json; indent=2'),
+            JSONRenderer().render({'a': 1}, 'application/json; indent=2'),
+        )
+
+    def test_renderer_is_faster_than_drf(self):
+        """Test that a large scan response renders faster than with JSONRenderer"""
+        import time
+        from rest_framework.renderers import JSONRenderer
+        from .renderers import FastJSONRenderer
+        data = {'results': [
+            {'status': 'success', 'kito_indicators': ['send me money'], 'confidence': round(0.5 + i / 40000, 4),
+             'matches': [{'indicator': 'send me money', 'start': i, 'end': i + 13}]}
+            for i in range(20000)
+        ]}
+
+        def best(renderer):
+            timings = []
+            for _ in range(3):
+                start = time.perf_counter()
+                renderer.render(data)
+                timings.append(time.perf_counter() - start)
+            return min(timings)
+
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertLess(best(FastJSONRenderer()), best(JSONRenderer()) / 2)
+
+    def test_parser_round_trip_and_errors(self):
+        """Test parsing valid and invalid bodies"""
+        import io
+        from rest_framework.exceptions import ParseError
+        from .parsers import FastJSONParser
+        body = '{"transcript": "naïve", "n": [1, 2.5, null, true]}'.encode()
+        self.assertEqual(
+            FastJSONParser().parse(io.BytesIO(body)),
+            {'transcript': 'naïve', 'n': [1, 2.5, None, True]},
+        )
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(io.BytesIO(b'{"a": NaN}'))
+
+    def test_ndjson_streaming(self):
+        """Test the NDJSON renderer and streaming response"""
+        from .renderers import NDJSONRenderer, NDJSONStreamingResponse
+        self.assertEqual(NDJSONRenderer().render([{'a': 1}, {'b': 2}]), b'{"a":1}\n{"b":2}\n')
+        response = NDJSONStreamingResponse({'i': i} for i in range(3))
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(b''.join(response.streaming_content), b'{"i":0}\n{"i":1}\n{"i":2}\n')
+
+    def test_ndjson_streams_under_asgi(self):
+        """Test that the ASGI handler sends each line as it is produced"""
+        from asgiref.sync import async_to_sync
+        from django.core.handlers.asgi import ASGIHandler
+        from .renderers import NDJSONStreamingResponse
+        produced = []
+
+        def items():
+            for i in range(3):
+                produced.append(i)
+                yield {'i': i}
+
+        sent = []
+
+        async def send(message):
+            if message['type'] == 'http.response.body' and message.get('body'):
+                sent.append((message['body'], len(produced)))
+
+        async_to_sync(ASGIHandler().send_response)(NDJSONStreamingResponse(items()), send)
+        self.assertEqual(sent, [(b'{"i":0}\n', 1), (b'{"i":1}\n', 2), (b'{"i":2}\n', 3)])
+
+
+@override_settings(KITO_PBKDF2_ITERATIONS=1000)
+class PasswordHashCalibrationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='hashed', email='hashed@example.com', password='testpassword123')
+
+    def iterations(self):
+        self.user.refresh_from_db()
+        return int(self.user.password.split('$')[1])
+
+    @staticmethod
+    def metric_values():
+        from django.core.cache import cache
+        from . import hashers
+        series = {
+            'upgrades': (hashers.password_rehashed_total, '', ('pbkdf2_sha256', 'upgrade')),
+            'downgrades': (hashers.password_rehashed_total, '', ('pbkdf2_sha256', 'downgrade')),
+            'checks': (hashers.login_password_check_seconds, '_count', ('pbkdf2_sha256',)),
+            'cost': (hashers.login_password_hash_cost, '_sum', ('pbkdf2_sha256',)),
+        }
+        return {name: cache.get(metric._key(values, suffix), 0) for name, (metric, suffix, values) in series.items()}
+
+    def test_login_rehashes_to_the_configured_cost(self):
+        """Test transparent upgrades and downgrades on successful logins only"""
+        from django.contrib.auth import authenticate
+        from .utils.metrics import MICRO
+        login = lambda password: self.client.post(
+            reverse('login'), {'email': 'hashed@example.com', 'password': password}, format='json'
+        )
+        before = self.metric_values()
+        self.assertEqual(self.iterations(), 1000)
+        with self.settings(KITO_PBKDF2_ITERATIONS=2000):
+            self.assertEqual(login('wrong-password').status_code, status.HTTP_401_UNAUTHORIZED)
+            self.assertEqual(self.iterations(), 1000)
+            self.assertEqual(login('testpassword123').status_code, status.HTTP_200_OK)
+            self.assertEqual(self.iterations(), 2000)
+        self.assertEqual(authenticate(username='hashed', password='testpassword123'), self.user)
+        self.assertEqual(self.iterations(), 1000)
+
+        after = self.metric_values()
+        delta = {name: after[name] - before[name] for name in after}
+        # Costs of the stored hashes checked: 1000 (failed), 1000, then 2000.
+        self.assertEqual(delta, {'upgrades': 1, 'downgrades': 1, 'checks': 3, 'cost': 4000 * MICRO})
+
+    @override_settings(PASSWORD_HASHERS=['api.hashers.CalibratedPBKDF2PasswordHasher'])
+    def test_calibration_command(self):
+        """Test that the calibration command recommends a PBKDF2 setting"""
+        import io
+        from django.core.management import call_command
+        out = io.StringIO()
+        call_command('calibrate_password_hashers', target_ms=5, samples=1, stdout=out)
+        self.assertRegex(out.getvalue(), r'recommended iterations=\d+')
+        self.assertIn('KITO_PBKDF2_ITERATIONS=', out.getvalue())
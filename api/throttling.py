@@ -0,0 +1,38 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.throttling import BaseThrottle
+
+from .usage import usage
+
+
+class ScanQuotaThrottle(BaseThrottle):
+    """
+    Daily scan quota: ``KITO_SCAN_DAILY_QUOTA`` per user, or
+    ``KITO_ANON_SCAN_DAILY_QUOTA`` per client address for anonymous
+    requests. A quota of 0 disables the check.
+
+    Views may define ``scan_cost(request)`` to charge batch requests for
+    every item; rejected requests are refunded.
+    """
+    def allow_request(self, request, view):
+        user = request.user
+        if user and user.is_authenticated:
+            subject, limit = user.pk, settings.KITO_SCAN_DAILY_QUOTA
+        else:
+            subject, limit = 'anon:' + self.get_ident(request), settings.KITO_ANON_SCAN_DAILY_QUOTA
+        if not limit:
+            return True
+
+        cost = view.scan_cost(request) if hasattr(view, 'scan_cost') else 1
+        day = timezone.localdate()
+        if usage.add(subject, day, cost) > limit:
+            usage.add(subject, day, -cost)
+            return False
+        return True
+
+    def wait(self):
+        now = timezone.localtime()
+        midnight = timezone.make_aware(datetime.combine(now.date() + timedelta(days=1), time.min))
+        return (midnight - now).total_seconds()
@@ -0,0 +1,108 @@
+"""
+Refresh token issuance and cleanup.
+
+With the simplejwt blacklist app installed, every ``RefreshToken.for_user``
+inserts an ``OutstandingToken`` row holding the full encoded token. In
+ledger mode (``KITO_TOKEN_LEDGER``) logins write a single compact
+``TokenLedgerEntry`` instead; simplejwt still creates the outstanding row
+lazily if the token is ever blacklisted. ``purge_expired_tokens`` removes
+expired rows from all token tables in small batches.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.tokens import BlacklistMixin, RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .models import BlacklistedToken, TokenLedgerEntry
+from .utils.metrics import Counter, Gauge
+
+token_table_rows = Gauge('token_table_rows', 'Approximate number of rows in each token table.', labels=['table'])
+token_purge_seconds = Gauge('token_purge_seconds', 'Duration of the last expired-token purge per table.', labels=['table'])
+token_purged_total = Counter('token_purged_total', 'Expired token rows deleted by purges.', labels=['table'])
+
+
+class LedgerRefreshToken(RefreshToken):
+    """
+    Refresh token that records itself in the compact token ledger.
+    """
+    @classmethod
+    def for_user(cls, user):
+        # Skip BlacklistMixin.for_user, which writes the OutstandingToken row.
+        token = super(BlacklistMixin, cls).for_user(user)
+        TokenLedgerEntry.objects.create(
+            jti=token[jwt_settings.JTI_CLAIM],
+            user=user,
+            expires_at=datetime_from_epoch(token['exp']),
+        )
+        return token
+
+
+def refresh_token_for(user):
+    """
+    Issue a refresh token for ``user`` using the configured storage mode.
+    """
+    if getattr(settings, 'KITO_TOKEN_LEDGER', False):
+        return LedgerRefreshToken.for_user(user)
+    return RefreshToken.for_user(user)
+
+
+def expired_querysets(now=None):
+    """
+    Return ``(label, queryset)`` pairs selecting expired rows in each token table.
+    """
+    now = now or timezone.now()
+    # Our logout table has no expiry column; a token blacklisted longer ago
+    # than the refresh lifetime has certainly expired.
+    blacklist_cutoff = now - jwt_settings.REFRESH_TOKEN_LIFETIME - timedelta(minutes=1)
+    return [
+        ('token_ledger', TokenLedgerEntry.objects.filter(expires_at__lt=now)),
+        ('outstanding_token', OutstandingToken.objects.filter(expires_at__lt=now)),
+        ('api_blacklisted_token', BlacklistedToken.objects.filter(blacklisted_at__lt=blacklist_cutoff)),
+    ]
+
+
+def estimated_rows(model):
+    """
+    Cheap row count: the planner estimate on PostgreSQL, COUNT(*) elsewhere.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+            row = cursor.fetchone()
+        if row and row[0] >= 0:
+            return row[0]
+    return model.objects.count()
+
+
+def purge_expired_tokens(batch_size=5000, pause=0.0, now=None):
+    """
+    Delete expired token rows in batches of ``batch_size`` primary keys, each
+    in its own short transaction, and record counts and durations as metrics.
+    Returns a mapping of table label to rows deleted.
+    """
+    deleted = {}
+    for label, queryset in expired_querysets(now):
+        started = time.monotonic()
+        total = 0
+        while True:
+            pks = list(queryset.order_by().values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            # Deleting through the model keeps simplejwt's blacklist cascade.
+            queryset.model.objects.filter(pk__in=pks).delete()
+            total += len(pks)
+            if len(pks) < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+        deleted[label] = total
+        token_purge_seconds.set(round(time.monotonic() - started, 6), table=label)
+        token_purged_total.inc(total, table=label)
+        token_table_rows.set(estimated_rows(queryset.model), table=label)
+    return deleted
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import SignUpView, LoginView, LogoutView, ImageScanView, ChatScanView, UserProfileView
+from .views import SignUpView, LoginView, LogoutView, ImageScanView, ChatScanView, ScanHistoryView, UserProfileView, MetricsView
 from rest_framework_simplejwt.views import TokenRefreshView
 
 urlpatterns = [
@@ -10,4 +10,6 @@ urlpatterns = [
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('image-scan/', ImageScanView.as_view(), name='image-scan'),
     path('chat-scan/', ChatScanView.as_view(), name='chat-scan'),
+    path('scans/', ScanHistoryView.as_view(), name='scan-history'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file
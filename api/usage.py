@@ -0,0 +1,145 @@
+"""
+Write-behind per-user daily scan counters.
+
+Counters live in the shared cache and each scan bumps one with an atomic
+``incr``, so concurrent requests never contend on a database row. Every
+process remembers which user counters it touched, and a background thread
+copies their current values into ``ScanUsage`` every
+``KITO_USAGE_FLUSH_INTERVAL`` seconds and once more at exit.
+
+Flushes write absolute values and never lower a stored count, so flushes
+from many workers, or a repeated flush, are harmless. When a counter is
+missing from the cache (the first scan of the day, an eviction or a cache
+restart) it is seeded from its ``ScanUsage`` row before being incremented.
+At most one flush interval of scans can be lost if a process dies without
+flushing while the cache is also lost.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+
+from .models import ScanUsage
+from .utils.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# Long enough to outlive the day plus any flush delay.
+KEY_TTL = 2 * 24 * 60 * 60
+
+scan_usage_flushed_total = Counter('scan_usage_flushed_total', 'Usage rows written behind to the database.')
+
+
+def usage_key(subject, day):
+    return f'usage:{day.isoformat()}:{subject}'
+
+
+def _upsert_sql():
+    table = connection.ops.quote_name(ScanUsage._meta.db_table)
+    return (
+        f'INSERT INTO {table} (user_id, day, scans) VALUES (%s, %s, %s) '
+        f'ON CONFLICT (user_id, day) DO UPDATE SET scans = excluded.scans '
+        f'WHERE {table}.scans < excluded.scans'
+    )
+
+
+class UsageCounters:
+    """
+    Cache-backed daily counters. Integer subjects are user ids and are
+    written behind to ``ScanUsage``; other subjects (anonymous clients)
+    only live in the cache.
+    """
+    def __init__(self):
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def add(self, subject, day, amount=1):
+        """
+        Add ``amount`` to the counter and return its new value.
+        """
+        key = usage_key(subject, day)
+        try:
+            value = cache.incr(key, amount)
+        except ValueError:
+            seed = self.durable_count(subject, day)
+            if cache.add(key, seed + amount, KEY_TTL):
+                value = seed + amount
+            else:
+                # Another request seeded it first.
+                value = cache.incr(key, amount)
+        if isinstance(subject, int):
+            with self._lock:
+                self._dirty.add((subject, day))
+            self._ensure_flusher()
+        return value
+
+    def durable_count(self, subject, day):
+        if not isinstance(subject, int):
+            return 0
+        row = ScanUsage.objects.filter(user_id=subject, day=day).values_list('scans', flat=True).first()
+        return row or 0
+
+    def flush(self):
+        """
+        Write the touched counters to ``ScanUsage``; returns rows written.
+        """
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return 0
+        keys = {usage_key(user_id, day): (user_id, day) for user_id, day in dirty}
+        values = cache.get_many(list(keys))
+        # Users deleted since their last scan would violate the foreign key.
+        existing = set(
+            get_user_model().objects.filter(pk__in={user_id for user_id, _ in dirty}).values_list('pk', flat=True)
+        )
+        params = [
+            (user_id, day, values[key])
+            for key, (user_id, day) in keys.items()
+            if key in values and user_id in existing
+        ]
+        try:
+            with connection.cursor() as cursor:
+                cursor.executemany(_upsert_sql(), params)
+        except DatabaseError:
+            with self._lock:
+                self._dirty |= dirty
+            raise
+        scan_usage_flushed_total.inc(len(params))
+        return len(params)
+
+    def _ensure_flusher(self):
+        # Threads do not survive fork, so start one per worker process.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        interval = getattr(settings, 'KITO_USAGE_FLUSH_INTERVAL', 30)
+        if interval > 0:
+            threading.Thread(target=self._run, args=(interval,), name='usage-flush', daemon=True).start()
+        atexit.register(self._flush_quietly)
+
+    def _run(self, interval):
+        while True:
+            time.sleep(interval)
+            self._flush_quietly()
+            # This thread has its own connection; don't hold it between flushes.
+            connection.close()
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Scan usage flush failed')
+
+
+usage = UsageCounters()
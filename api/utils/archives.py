@@ -0,0 +1,180 @@
+"""
+Streaming scans of ZIP archives of images.
+
+Archives are read member by member from the uploaded file with
+``zipfile``; nothing is extracted to disk. Before any member is
+decompressed the central directory is checked against limits on member
+count, declared sizes and compression ratio, so typical zip bombs are
+rejected up front. While reading, actual decompressed bytes are counted
+against the declared sizes too, in case the headers lie.
+
+Members are grouped into batches of ``KITO_IMAGE_BATCH_SIZE`` for
+vectorised feature extraction, and batches go to a process pool through a
+bounded window of in-flight jobs. Results are yielded in archive order, so
+memory use depends on the window, the batch size and the per-member limit,
+not on the archive size.
+"""
+import multiprocessing
+import os
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from django.conf import settings
+
+from .images import IMAGE_EXTENSIONS, analyze_images
+
+CHUNK_SIZE = 64 * 1024
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+def _limit(name, default):
+    return getattr(settings, name, default)
+
+
+def get_image_pool():
+    """
+    The per-process image worker pool, or ``None`` to analyse inline
+    (``KITO_IMAGE_WORKERS = 0``).
+    """
+    global _pool, _pool_pid
+    workers = _limit('KITO_IMAGE_WORKERS', os.cpu_count() or 1)
+    if workers <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # Spawn rather than fork: web workers run background threads.
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def is_image(info):
+    return not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def open_archive(fileobj):
+    """
+    Open ``fileobj`` as a ZIP file and return ``(archive, image members)``,
+    raising ``ArchiveError`` if it is invalid or exceeds the declared-size limits.
+    """
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except (zipfile.BadZipFile, OSError) as exc:
+        raise ArchiveError('not a valid ZIP archive') from exc
+
+    members = [info for info in archive.infolist() if is_image(info)]
+    max_members = _limit('KITO_ARCHIVE_MAX_MEMBERS', 1000)
+    max_member_bytes = _limit('KITO_ARCHIVE_MAX_MEMBER_BYTES', 20 * 1024 * 1024)
+    max_total_bytes = _limit('KITO_ARCHIVE_MAX_TOTAL_BYTES', 512 * 1024 * 1024)
+    max_ratio = _limit('KITO_ARCHIVE_MAX_RATIO', 100)
+    try:
+        if len(members) > max_members:
+            raise ArchiveError(f'archive has {len(members)} images; the limit is {max_members}')
+        if sum(info.file_size for info in members) > max_total_bytes:
+            raise ArchiveError(f'archive expands to more than {max_total_bytes} bytes')
+        for info in members:
+            if info.file_size > max_member_bytes:
+                raise ArchiveError(f'{info.filename} expands to more than {max_member_bytes} bytes')
+            if info.file_size > CHUNK_SIZE and info.file_size > max_ratio * max(info.compress_size, 1):
+                raise ArchiveError(f'{info.filename} has a suspicious compression ratio')
+    except ArchiveError:
+        archive.close()
+        raise
+    return archive, members
+
+
+def read_member(archive, info, budget):
+    """
+    Decompress one member in chunks, failing as soon as it produces more
+    than its declared size or the remaining ``budget``.
+    """
+    chunks = []
+    size = 0
+    with archive.open(info) as member:
+        while chunk := member.read(CHUNK_SIZE):
+            size += len(chunk)
+            if size > info.file_size or size > budget:
+                raise ArchiveError(f'{info.filename} is larger than declared')
+            chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def _done(results):
+    future = Future()
+    future.set_result(results)
+    return future
+
+
+def scan_archive(archive, members, pool=None):
+    """
+    Yield one result dict per image member, in archive order, then a final
+    ``{'summary': ...}`` item. Closes ``archive`` when done.
+    """
+    # Two batches per worker keep the pool busy while bounding memory.
+    window = 2 * max(_limit('KITO_IMAGE_WORKERS', os.cpu_count() or 1), 1)
+    batch_size = max(_limit('KITO_IMAGE_BATCH_SIZE', 16), 1)
+    budget = _limit('KITO_ARCHIVE_MAX_TOTAL_BYTES', 512 * 1024 * 1024)
+    max_pixels = _limit('KITO_IMAGE_MAX_PIXELS', 40_000_000)
+    pending = deque()
+    batch = []
+    counts = {'success': 0, 'error': 0}
+    aborted = None
+
+    def submit():
+        if not batch:
+            return
+        if pool is None:
+            pending.append(_done(analyze_images(batch, max_pixels)))
+        else:
+            pending.append(pool.submit(analyze_images, list(batch), max_pixels))
+        batch.clear()
+
+    def rejected(info, error):
+        # Flush the open batch first so results stay in archive order.
+        submit()
+        pending.append(_done([{'name': info.filename, 'status': 'error', 'error': error}]))
+
+    try:
+        for info in members:
+            if info.flag_bits & 0x1:
+                rejected(info, 'member is encrypted')
+            else:
+                try:
+                    data = read_member(archive, info, budget)
+                except zipfile.BadZipFile as exc:
+                    rejected(info, str(exc))
+                except ArchiveError as exc:
+                    aborted = str(exc)
+                    break
+                else:
+                    budget -= len(data)
+                    batch.append((info.filename, data))
+                    if len(batch) >= batch_size:
+                        submit()
+            while len(pending) >= window:
+                for result in pending.popleft().result():
+                    counts[result['status']] += 1
+                    yield result
+        submit()
+        while pending:
+            for result in pending.popleft().result():
+                counts[result['status']] += 1
+                yield result
+    finally:
+        for future in pending:
+            future.cancel()
+        archive.close()
+
+    summary = {'images': counts['success'] + counts['error'], **counts}
+    if aborted:
+        summary['error'] = aborted
+    yield {'summary': summary}
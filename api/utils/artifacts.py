@@ -0,0 +1,220 @@
+"""
+Memory-mapped model artifacts for the scan engine.
+
+An artifact is a single flat file holding a small JSON header followed by
+raw, 64-byte aligned NumPy arrays:
+
+    magic (8 bytes) | version (uint32) | header length (uint32) | header JSON | arrays
+
+Arrays are exposed as read-only views over an ``mmap`` of the file, so every
+process mapping the same file shares the same page-cache pages instead of
+holding a private copy. Artifacts are published with ``write_artifact``,
+which writes to a temporary file and atomically renames it into place;
+readers pick up the new inode on their next ``ArtifactStore.get`` after the
+reload interval, while in-flight requests keep using the old mapping.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'KITOART\x00'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+PREAMBLE = struct.Struct('<8sII')
+ARTIFACT_SUFFIX = '.kda'
+
+
+class ArtifactError(Exception):
+    pass
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_artifact(path, arrays, kind, meta=None):
+    """
+    Atomically write ``arrays`` (a mapping of name to ndarray) to ``path``.
+    """
+    path = Path(path)
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+    # Array offsets are relative to the first aligned byte after the header.
+    layout = {}
+    relative = 0
+    for name, array in arrays.items():
+        relative = _align(relative)
+        layout[name] = {
+            'dtype': array.dtype.str,
+            'shape': list(array.shape),
+            'offset': relative,
+        }
+        relative += array.nbytes
+    header = {'kind': kind, 'meta': meta or {}, 'arrays': layout}
+    header_bytes = json.dumps(header, sort_keys=True).encode()
+    data_start = _align(PREAMBLE.size + len(header_bytes))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            for name, array in arrays.items():
+                f.seek(data_start + layout[name]['offset'])
+                f.write(array.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return path
+
+
+class Artifact:
+    """
+    A read-only, memory-mapped artifact. Arrays are views into the mapping.
+    Raises ``ArtifactError`` if the file is truncated or malformed.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.identity = (stat.st_dev, stat.st_ino, stat.st_mtime_ns)
+            if not stat.st_size:
+                raise ArtifactError(f'{self.path} is empty')
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._parse()
+        except (struct.error, ValueError, KeyError, TypeError) as exc:
+            raise ArtifactError(f'{self.path} is corrupt: {exc!r}') from exc
+
+    def _parse(self):
+        magic, version, header_len = PREAMBLE.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ArtifactError(f'{self.path} is not a kitodeck artifact')
+        if version != FORMAT_VERSION:
+            raise ArtifactError(f'{self.path} has unsupported format version {version}')
+        header = json.loads(self._mmap[PREAMBLE.size:PREAMBLE.size + header_len])
+        data_start = _align(PREAMBLE.size + header_len)
+
+        self.kind = header['kind']
+        self.meta = header['meta']
+        self.arrays = {}
+        for name, spec in header['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape'], dtype=np.int64))
+            self.arrays[name] = np.frombuffer(
+                self._mmap, dtype=dtype, count=count, offset=data_start + spec['offset']
+            ).reshape(spec['shape'])
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    @property
+    def nbytes(self):
+        return len(self._mmap)
+
+    def warm(self):
+        """
+        Fault every page into the page cache so forked workers start warm.
+        """
+        for offset in range(0, len(self._mmap), mmap.PAGESIZE):
+            self._mmap[offset]
+
+
+class ArtifactStore:
+    """
+    Process-wide registry of named artifacts under ``KITO_ARTIFACT_DIR``.
+
+    Lookups re-stat the file at most once per ``KITO_ARTIFACT_RELOAD_INTERVAL``
+    seconds and remap it when the inode changed, which is what an atomic
+    ``write_artifact`` produces.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = {}
+        # name -> identity of a file that failed to load.
+        self._broken = {}
+
+    @property
+    def directory(self):
+        return Path(getattr(settings, 'KITO_ARTIFACT_DIR', None) or settings.BASE_DIR / 'artifacts')
+
+    def path_for(self, name):
+        return self.directory / f'{name}{ARTIFACT_SUFFIX}'
+
+    def get(self, name):
+        """
+        Return the current ``Artifact`` for ``name``, or ``None`` if it does
+        not exist or cannot be read.
+        """
+        now = time.monotonic()
+        interval = getattr(settings, 'KITO_ARTIFACT_RELOAD_INTERVAL', 30)
+        entry = self._loaded.get(name)
+        if entry is not None and now - entry[1] < interval:
+            return entry[0]
+
+        with self._lock:
+            entry = self._loaded.get(name)
+            path = self.path_for(name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                self._loaded.pop(name, None)
+                return None
+            identity = (stat.st_dev, stat.st_ino, stat.st_mtime_ns)
+            if entry is not None and entry[0].identity == identity:
+                artifact = entry[0]
+            elif self._broken.get(name) == identity:
+                return None
+            else:
+                try:
+                    artifact = Artifact(path)
+                except ArtifactError:
+                    # Logged once per file; the next publish replaces it.
+                    logger.exception("Ignoring unreadable artifact %s", path)
+                    self._broken[name] = identity
+                    self._loaded.pop(name, None)
+                    return None
+                logger.info("Mapped artifact %s (%d bytes)", path, artifact.nbytes)
+            self._broken.pop(name, None)
+            self._loaded[name] = (artifact, now)
+            return artifact
+
+    def names(self):
+        if not self.directory.is_dir():
+            return []
+        return sorted(p.name[:-len(ARTIFACT_SUFFIX)] for p in self.directory.glob(f'*{ARTIFACT_SUFFIX}'))
+
+
+artifact_store = ArtifactStore()
+
+
+def preload_artifacts():
+    """
+    Map and warm every artifact and build the in-memory models on top of them.
+    Called from the gunicorn master (``preload_app``) so forked workers
+    inherit the mappings instead of each loading their own copy.
+    """
+    from .classifier import get_classifier
+
+    for name in artifact_store.names():
+        artifact = artifact_store.get(name)
+        if artifact is not None:
+            artifact.warm()
+    get_classifier()
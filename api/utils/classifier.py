@@ -0,0 +1,251 @@
+"""
+Hashed n-gram classifier used to attach a confidence score to chat scans.
+
+Transcripts are normalised the same way the indicator matcher sees them
+(see ``api.utils.normalize``), so "S3nd m0ney" scores like "send money",
+then tokenised into word unigrams and bigrams; each n-gram is hashed into a
+fixed number of buckets and scored against a weight vector. Scoring is done
+for a whole batch at once with NumPy, so the per-transcript cost is the
+normalisation and tokenisation plus a single ``bincount`` over the batch.
+
+Trained weights are published as the ``chat_classifier`` artifact (see
+``api.utils.artifacts``) so that all workers share one memory-mapped copy.
+"""
+import json
+import logging
+import re
+import threading
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from .artifacts import ArtifactError, artifact_store, write_artifact
+from .normalize import normalize
+
+logger = logging.getLogger(__name__)
+
+N_FEATURES = 1 << 18
+FEATURE_MASK = N_FEATURES - 1
+
+TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+# Folds used to produce held-out scores for calibration.
+CALIBRATION_FOLDS = 5
+
+ARTIFACT_NAME = 'chat_classifier'
+SEED_CORPUS_PATH = Path(__file__).resolve().parent.parent / 'data' / 'chat_seed_corpus.json'
+
+
+def extract_ngrams(text):
+    tokens = TOKEN_RE.findall(text.lower())
+    return tokens + [f'{a} {b}' for a, b in zip(tokens, tokens[1:])]
+
+
+def hash_features(texts):
+    """
+    Return ``(rows, cols)`` index arrays for a batch of texts, where each pair
+    is one hashed n-gram occurrence belonging to transcript ``rows[i]``.
+    """
+    rows = []
+    cols = []
+    crc32 = zlib.crc32
+    for i, text in enumerate(texts):
+        grams = extract_ngrams(normalize(text).text)
+        rows.extend([i] * len(grams))
+        cols.extend(crc32(gram.encode()) & FEATURE_MASK for gram in grams)
+    return np.asarray(rows, dtype=np.int32), np.asarray(cols, dtype=np.int32)
+
+
+def _sigmoid(z):
+    # tanh form avoids overflow warnings for large magnitudes
+    return 0.5 * (1.0 + np.tanh(0.5 * z))
+
+
+def _fit_platt(scores, labels, iterations=50, l2=1e-3):
+    """
+    Fit Platt scaling parameters ``(a, b)`` so that ``sigmoid(a * score + b)``
+    is a calibrated probability, using damped Newton steps on the log loss.
+    """
+    n_pos = labels.sum()
+    n_neg = len(labels) - n_pos
+    targets = np.where(labels, (n_pos + 1.0) / (n_pos + 2.0), 1.0 / (n_neg + 2.0))
+
+    def loss(params):
+        z = params[0] * scores + params[1]
+        # log(1 + e^z) - t * z, written to stay finite for large |z|
+        return np.sum(np.logaddexp(0.0, z) - targets * z) + 0.5 * l2 * np.dot(params, params)
+
+    params = np.array([1.0, 0.0])
+    current = loss(params)
+    for _ in range(iterations):
+        p = _sigmoid(params[0] * scores + params[1])
+        d = p - targets
+        w = p * (1.0 - p)
+        grad = np.array([np.dot(d, scores), d.sum()]) + l2 * params
+        hess = np.array([
+            [np.dot(w, scores * scores) + l2, np.dot(w, scores)],
+            [np.dot(w, scores), w.sum() + l2],
+        ])
+        step = np.linalg.solve(hess, grad)
+        scale = 1.0
+        while scale > 1e-6 and loss(params - scale * step) > current:
+            scale *= 0.5
+        params = params - scale * step
+        previous, current = current, loss(params)
+        if previous - current < 1e-10:
+            break
+    return float(params[0]), float(params[1])
+
+
+class HashedNgramClassifier:
+    """
+    Linear model over hashed n-gram counts with Platt-calibrated output.
+    """
+    def __init__(self, weights, bias, calibration=(1.0, 0.0)):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = float(bias)
+        self.calibration = tuple(float(c) for c in calibration)
+
+    @classmethod
+    def fit(cls, texts, labels, alpha=1.0, folds=CALIBRATION_FOLDS):
+        """
+        Train a multinomial naive Bayes model on all of ``texts`` and fit its
+        Platt scaling on held-out scores: each text is scored by a model
+        trained on the other ``folds - 1`` folds, so the calibration sees how
+        the model does on text it was not trained on.
+        """
+        labels = np.asarray(labels, dtype=bool)
+        texts = list(texts)
+        # Stratified folds: deal each class out in turn.
+        fold = np.empty(len(labels), dtype=np.intp)
+        for cls_mask in (labels, ~labels):
+            fold[cls_mask] = np.arange(cls_mask.sum()) % folds
+        held_out = np.empty(len(labels))
+        for k in range(folds):
+            test = fold == k
+            train = np.flatnonzero(~test)
+            model = cls._fit_naive_bayes([texts[i] for i in train], labels[train], alpha)
+            held_out[test] = model.decision_function([texts[i] for i in np.flatnonzero(test)])
+
+        model = cls._fit_naive_bayes(texts, labels, alpha)
+        model.calibration = _fit_platt(held_out, labels)
+        return model
+
+    @classmethod
+    def _fit_naive_bayes(cls, texts, labels, alpha):
+        """
+        Uncalibrated multinomial naive Bayes. Buckets never seen in training
+        get a zero weight so that unrelated words do not drag long
+        transcripts towards either class.
+        """
+        rows, cols = hash_features(texts)
+        is_pos = labels[rows]
+        pos = np.bincount(cols[is_pos], minlength=N_FEATURES).astype(np.float64)
+        neg = np.bincount(cols[~is_pos], minlength=N_FEATURES).astype(np.float64)
+        seen = (pos + neg) > 0
+
+        weights = np.zeros(N_FEATURES, dtype=np.float64)
+        weights[seen] = (
+            np.log((pos[seen] + alpha) / (pos[seen].sum() + alpha * seen.sum()))
+            - np.log((neg[seen] + alpha) / (neg[seen].sum() + alpha * seen.sum()))
+        )
+        prior = labels.mean()
+        bias = np.log(prior / (1.0 - prior))
+
+        return cls(weights, bias)
+
+    def decision_function(self, texts):
+        rows, cols = hash_features(texts)
+        scores = np.bincount(rows, weights=self.weights[cols], minlength=len(texts))
+        return scores + self.bias
+
+    def predict_proba(self, texts):
+        """
+        Return the calibrated probability that each transcript is a kito attempt.
+        """
+        a, b = self.calibration
+        return _sigmoid(a * self.decision_function(texts) + b)
+
+    @classmethod
+    def from_artifact(cls, artifact):
+        """
+        Build a model over ``artifact``'s weights, which stay a read-only view
+        into the shared mapping. Raises ``ArtifactError`` unless the artifact
+        holds finite weights of the expected shape, so scores stay finite.
+        """
+        try:
+            weights = artifact['weights']
+            bias = float(artifact.meta['bias'])
+            calibration = [float(c) for c in artifact.meta['calibration']]
+        except (KeyError, TypeError, ValueError) as exc:
+            raise ArtifactError(f'{artifact.path} is not a chat classifier: {exc!r}') from exc
+        if (
+            artifact.kind != ARTIFACT_NAME
+            or weights.shape != (N_FEATURES,)
+            or len(calibration) != 2
+            or not np.isfinite(weights).all()
+            or not np.isfinite([bias, *calibration]).all()
+        ):
+            raise ArtifactError(f'{artifact.path} is not a valid chat classifier')
+        return cls(weights, bias, calibration)
+
+    def save(self, path):
+        return write_artifact(
+            path,
+            {'weights': self.weights},
+            kind=ARTIFACT_NAME,
+            meta={
+                'bias': self.bias,
+                'calibration': list(self.calibration),
+                'n_features': N_FEATURES,
+            },
+        )
+
+
+def load_seed_corpus():
+    with open(SEED_CORPUS_PATH, encoding='utf-8') as f:
+        corpus = json.load(f)
+    texts = corpus['kito'] + corpus['safe']
+    labels = [True] * len(corpus['kito']) + [False] * len(corpus['safe'])
+    return texts, labels
+
+
+_classifier_lock = threading.Lock()
+_classifier = (None, None)
+
+
+def get_classifier():
+    """
+    Return the process-wide classifier. The model is rebuilt only when the
+    ``chat_classifier`` artifact is swapped; without a usable artifact a
+    model is trained once on the bundled seed corpus.
+    """
+    global _classifier
+    artifact = artifact_store.get(ARTIFACT_NAME)
+    source, model = _classifier
+    if model is not None and source is artifact:
+        return model
+    with _classifier_lock:
+        source, model = _classifier
+        if model is None or source is not artifact:
+            model = None
+            if artifact is not None:
+                try:
+                    model = HashedNgramClassifier.from_artifact(artifact)
+                except ArtifactError:
+                    logger.exception('Falling back to the seed-trained chat classifier')
+            if model is None:
+                model = HashedNgramClassifier.fit(*load_seed_corpus())
+            _classifier = (artifact, model)
+        return model
+
+
+def score_transcripts(transcripts):
+    """
+    Return a list of calibrated confidences, rounded for the API response.
+    """
+    if not transcripts:
+        return []
+    probabilities = get_classifier().predict_proba(transcripts)
+    return [round(float(p), 4) for p in probabilities]
@@ -1,7 +1,7 @@
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.template.loader import render_to_string
 
-def send_welcome_email(user):
+def build_welcome_email(user, connection=None):
     subject = "Welcome to KitoDeck Ai!"
     from_email = "KitoDeck AI <noreply@kitodeck.ai>"
     to = [user.email]
@@ -15,6 +15,20 @@ def send_welcome_email(user):
 
     html_context = render_to_string("emails/welcome.html", context)
 
-    msg = EmailMultiAlternatives(subject, html_context, from_email, to)
+    msg = EmailMultiAlternatives(subject, html_context, from_email, to, connection=connection)
     msg.content_subtype = "html"
-    msg.send()
\ No newline at end of file
+    return msg
+
+
+def send_welcome_email(user):
+    build_welcome_email(user).send()
+
+
+def send_welcome_emails(users, connection=None):
+    """
+    Send welcome emails for many users over a single SMTP connection.
+    Returns the number of messages sent.
+    """
+    connection = connection or get_connection()
+    messages = [build_welcome_email(user, connection) for user in users if user.email]
+    return connection.send_messages(messages) or 0
\ No newline at end of file
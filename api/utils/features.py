@@ -0,0 +1,122 @@
+"""
+Vectorised image features for the scan engine.
+
+Images are downscaled to ``THUMBNAIL_SIZE`` squares and written straight
+into one preallocated ``(n, size, size, 3)`` array: full-resolution pixels
+are never converted to NumPy, and each thumbnail is copied once, through
+the array interface, into its batch slot. Every feature is
+then computed for the whole batch at once with array operations; there are
+no per-pixel Python loops.
+
+Like ``api.utils.images`` this runs inside the image worker pool and must
+not import Django.
+"""
+import numpy as np
+from PIL import Image
+
+THUMBNAIL_SIZE = 128
+
+# 4 levels per channel: 64 colour bins.
+HISTOGRAM_LEVELS = 4
+HISTOGRAM_BINS = HISTOGRAM_LEVELS ** 3
+
+# RGB -> YCbCr (ITU-R BT.601, full range), applied as ``pixels @ YCBCR.T``.
+YCBCR = np.array([
+    [0.299, 0.587, 0.114],
+    [-0.168736, -0.331264, 0.5],
+    [0.5, -0.418688, -0.081312],
+], dtype=np.float32)
+YCBCR_OFFSET = np.array([0, 128, 128], dtype=np.float32)
+
+# Skin-tone box in the CbCr plane (Chai & Ngan).
+SKIN_CB = (77, 127)
+SKIN_CR = (133, 173)
+
+# A histogram bin holding less than this share of the pixels counts as unused.
+COLOUR_BIN_MIN_SHARE = 0.001
+
+
+def thumbnail(image, size=THUMBNAIL_SIZE):
+    """
+    Downscale ``image`` to an RGB ``size`` x ``size`` square. Large images
+    are first shrunk by an integer factor with ``reduce``, which is much
+    cheaper than resampling from full resolution.
+    """
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image.resize((size, size), Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+
+def to_batch(images, size=THUMBNAIL_SIZE):
+    """
+    Stack ``images`` into a ``uint8`` array of shape ``(n, size, size, 3)``.
+    """
+    batch = np.empty((len(images), size, size, 3), dtype=np.uint8)
+    for slot, image in zip(batch, images):
+        small = thumbnail(image, size)
+        slot[...] = np.asarray(small)
+    return batch
+
+
+def colour_histograms(batch):
+    """
+    Per-image 64-bin RGB histograms, normalised to sum to 1.
+    """
+    n = len(batch)
+    quantized = batch // (256 // HISTOGRAM_LEVELS)
+    bins = (quantized[..., 0].astype(np.intp) * HISTOGRAM_LEVELS + quantized[..., 1]) * HISTOGRAM_LEVELS
+    bins += quantized[..., 2]
+    # Offset each image's bins so one bincount covers the whole batch.
+    bins += (np.arange(n, dtype=np.intp) * HISTOGRAM_BINS)[:, None, None]
+    counts = np.bincount(bins.ravel(), minlength=n * HISTOGRAM_BINS).reshape(n, HISTOGRAM_BINS)
+    return counts / (batch.shape[1] * batch.shape[2])
+
+
+def extract_features(batch):
+    """
+    Compute the scan features of every image in ``batch`` (see
+    ``to_batch``) and return one dict per image:
+
+    ``skin_ratio``
+        share of pixels in the skin-tone CbCr box;
+    ``blur``
+        variance of the Laplacian of the luma (low means blurry);
+    ``flat_ratio``
+        share of pixels identical to their right-hand neighbour, which is
+        high for screenshots and rendered UI and low for photographs;
+    ``colours``
+        number of the 64 colour bins in use;
+    ``dominant_colour_share``
+        share of pixels in the most common colour bin.
+    """
+    if not len(batch):
+        return []
+    ycc = batch.astype(np.float32) @ YCBCR.T
+    ycc += YCBCR_OFFSET
+    luma, cb, cr = ycc[..., 0], ycc[..., 1], ycc[..., 2]
+
+    skin = (cb >= SKIN_CB[0]) & (cb <= SKIN_CB[1]) & (cr >= SKIN_CR[0]) & (cr <= SKIN_CR[1])
+    skin_ratio = skin.mean(axis=(1, 2))
+
+    laplacian = (
+        luma[:, :-2, 1:-1] + luma[:, 2:, 1:-1] + luma[:, 1:-1, :-2] + luma[:, 1:-1, 2:]
+        - 4 * luma[:, 1:-1, 1:-1]
+    )
+    blur = laplacian.var(axis=(1, 2))
+
+    flat_ratio = (batch[:, :, 1:] == batch[:, :, :-1]).all(axis=-1).mean(axis=(1, 2))
+
+    histograms = colour_histograms(batch)
+    colours = (histograms >= COLOUR_BIN_MIN_SHARE).sum(axis=1)
+    dominant = histograms.max(axis=1)
+
+    return [
+        {
+            'skin_ratio': round(float(skin_ratio[i]), 4),
+            'blur': round(float(blur[i]), 2),
+            'flat_ratio': round(float(flat_ratio[i]), 4),
+            'colours': int(colours[i]),
+            'dominant_colour_share': round(float(dominant[i]), 4),
+        }
+        for i in range(len(batch))
+    ]
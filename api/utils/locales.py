@@ -0,0 +1,104 @@
+"""
+Locale-tagged keyword packs and transcript language detection.
+
+Each pack is a JSON file in ``api/data/keyword_packs/<locale>.json``::
+
+    {
+        "name": "Nigerian Pidgin",
+        "markers": ["abeg", "wetin", ...],
+        "scripts": "",
+        "phrases": ["abeg send money", ...],
+        "patterns": {"indicator": "regex", ...}
+    }
+
+``markers`` are common, distinctive words of the language, at least
+``MIN_MARKER_LENGTH`` letters long (shorter ones such as Yoruba "ti" or
+"mi" turn up in English chat and names), and ``scripts``
+lists letters only that language uses (Yoruba's dot-below vowels, Hausa's
+hooked consonants). Packs are small and read once; their rules are only
+compiled when a transcript in that locale is first scanned (see
+``api.utils.scanner``).
+"""
+import json
+import re
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+
+PACK_DIR = Path(__file__).resolve().parent.parent / 'data' / 'keyword_packs'
+
+# Shard for moderator rules that apply to every transcript.
+COMMON = ''
+
+WORD_RE = re.compile(r'[^\W\d_]+')
+
+MIN_MARKER_LENGTH = 3
+
+
+class KeywordPack:
+    __slots__ = ('locale', 'name', 'markers', 'scripts', 'phrases', 'patterns')
+
+    def __init__(self, locale, name, markers=(), scripts='', phrases=(), patterns=None):
+        self.locale = locale
+        self.name = name
+        self.markers = frozenset(markers)
+        self.scripts = scripts
+        self.phrases = list(phrases)
+        self.patterns = dict(patterns or {})
+
+
+@lru_cache(maxsize=None)
+def keyword_packs():
+    """
+    Return every pack, keyed by locale.
+    """
+    packs = {}
+    for path in sorted(PACK_DIR.glob('*.json')):
+        with open(path, encoding='utf-8') as f:
+            packs[path.stem] = KeywordPack(path.stem, **json.load(f))
+    return packs
+
+
+def available_locales():
+    return tuple(keyword_packs())
+
+
+@lru_cache(maxsize=None)
+def _detectors():
+    # word -> locales using it as a marker, plus one character class per script.
+    markers = {}
+    scripts = []
+    for pack in keyword_packs().values():
+        for word in pack.markers:
+            if len(word) < MIN_MARKER_LENGTH:
+                continue
+            markers.setdefault(word, []).append(pack.locale)
+        if pack.scripts:
+            scripts.append((pack.locale, re.compile('[' + re.escape(pack.scripts) + ']')))
+    return markers, scripts
+
+
+def detect_locales(normalized, original):
+    """
+    Return the set of locales whose marker words appear in the normalised
+    transcript or whose script letters appear in the original one.
+    """
+    markers, scripts = _detectors()
+    found = set()
+    for word in set(WORD_RE.findall(normalized)):
+        found.update(markers.get(word, ()))
+    for locale, pattern in scripts:
+        if locale not in found and pattern.search(original):
+            found.add(locale)
+    return found
+
+
+def resolve_locales(detected, hint=None):
+    """
+    Order the locales to scan: the common shard, the configured defaults,
+    then ``hint`` if given, otherwise the detected locales.
+    """
+    wanted = set(getattr(settings, 'KITO_DEFAULT_LOCALES', ['en']))
+    wanted.update([hint] if hint else detected)
+    return [COMMON] + [locale for locale in available_locales() if locale in wanted]
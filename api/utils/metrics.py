@@ -0,0 +1,134 @@
+"""
+Lightweight application metrics.
+
+Values live in the Django cache, so with a shared cache backend (see
+``CACHES`` in settings) every worker and management command reports into
+the same series. ``render_metrics`` exposes them in the Prometheus text
+format for ``MetricsView``.
+"""
+from django.core.cache import cache
+
+PREFIX = 'kitodeck_'
+KEY_PREFIX = 'metrics'
+# Cache timeout of None keeps metric values until they are overwritten.
+FOREVER = None
+# Summaries store their sum as an integer number of micro-units so that
+# cache.incr can be used to update it atomically.
+MICRO = 1_000_000
+
+REGISTRY = []
+_known_series = set()
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        REGISTRY.append(self)
+
+    def _label_values(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f'{self.name} expects labels {self.labels}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _key(self, values, suffix=''):
+        return ':'.join((KEY_PREFIX, self.name + suffix) + values)
+
+    def _index_key(self):
+        return f'{KEY_PREFIX}:{self.name}:series'
+
+    def _register(self, values):
+        # Label sets are remembered in a cache index so the exporter can find
+        # them; each process only touches the index the first time it sees one.
+        if (self.name, values) in _known_series:
+            return
+        index = cache.get(self._index_key()) or []
+        if list(values) not in index:
+            index.append(list(values))
+            cache.set(self._index_key(), index, FOREVER)
+        _known_series.add((self.name, values))
+
+    def series(self):
+        return [tuple(values) for values in cache.get(self._index_key()) or []]
+
+    def _increment(self, key, amount):
+        cache.add(key, 0, FOREVER)
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            # The key was evicted between add() and incr().
+            cache.set(key, amount, FOREVER)
+
+    def _format_labels(self, values):
+        if not values:
+            return ''
+        pairs = ','.join(f'{name}="{value}"' for name, value in zip(self.labels, values))
+        return '{' + pairs + '}'
+
+    def samples(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        values = self._label_values(labels)
+        self._register(values)
+        self._increment(self._key(values), amount)
+
+    def samples(self):
+        series = self.series()
+        current = cache.get_many([self._key(values) for values in series])
+        for values in series:
+            yield self.name, values, current.get(self._key(values), 0)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        values = self._label_values(labels)
+        self._register(values)
+        cache.set(self._key(values), value, FOREVER)
+
+    def samples(self):
+        series = self.series()
+        current = cache.get_many([self._key(values) for values in series])
+        for values in series:
+            if self._key(values) in current:
+                yield self.name, values, current[self._key(values)]
+
+
+class Summary(Metric):
+    kind = 'summary'
+
+    def observe(self, value, **labels):
+        values = self._label_values(labels)
+        self._register(values)
+        self._increment(self._key(values, '_count'), 1)
+        self._increment(self._key(values, '_sum'), int(round(value * MICRO)))
+
+    def samples(self):
+        series = self.series()
+        keys = [self._key(values, suffix) for values in series for suffix in ('_count', '_sum')]
+        current = cache.get_many(keys)
+        for values in series:
+            yield self.name + '_count', values, current.get(self._key(values, '_count'), 0)
+            yield self.name + '_sum', values, current.get(self._key(values, '_sum'), 0) / MICRO
+
+
+def render_metrics():
+    """
+    Return every registered metric in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, values, value in metric.samples():
+            lines.append(f'{name}{metric._format_labels(values)} {value}')
+    return '\n'.join(lines) + '\n'
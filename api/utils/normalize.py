@@ -0,0 +1,167 @@
+"""
+Obfuscation-tolerant text normalisation for the scan engine.
+
+``normalize`` folds case, accents, homoglyphs and exotic whitespace with
+one precomputed ``str.translate`` table, then folds leetspeak inside words
+that contain letters (so "m0ney" becomes "money" but "0801 234 5678" keeps
+its digits), drops zero-width characters and collapses whitespace runs,
+all with vectorised NumPy masks. The result keeps, for every normalised
+character, the index of the character it came from, so matches can be
+reported against the original transcript.
+"""
+import unicodedata
+
+import numpy as np
+
+# Marker for characters that are removed entirely (zero-width, combining marks).
+DROP = '\x00'
+
+LEET = {
+    '0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', '7': 't', '8': 'b',
+    '@': 'a', '$': 's', '!': 'i', '|': 'l', '€': 'e', '£': 'l',
+}
+
+# Leet characters that are also ordinary punctuation ("send money!", "a | b"):
+# folded only with a letter or digit on both sides, as in "b!tco|n".
+INFIX_LEET = '!|'
+
+# Cyrillic and Greek letters that render like Latin ones.
+CONFUSABLES = {
+    'а': 'a', 'в': 'b', 'е': 'e', 'ё': 'e', 'к': 'k', 'м': 'm', 'н': 'h',
+    'о': 'o', 'р': 'p', 'с': 'c', 'т': 't', 'у': 'y', 'х': 'x', 'і': 'i',
+    'ї': 'i', 'ј': 'j', 'ѕ': 's', 'ԁ': 'd', 'ԛ': 'q', 'ԝ': 'w', 'һ': 'h',
+    'α': 'a', 'β': 'b', 'ε': 'e', 'η': 'n', 'ι': 'i', 'κ': 'k', 'μ': 'u',
+    'ν': 'v', 'ο': 'o', 'ρ': 'p', 'τ': 't', 'υ': 'u', 'χ': 'x', 'ω': 'w',
+    'ɡ': 'g', 'ı': 'i', 'ł': 'l', 'ø': 'o', 'đ': 'd', 'ß': 's',
+}
+
+ZERO_WIDTH = (
+    '\u00ad\u034f\u061c\u115f\u1160\u17b4\u17b5\u180e\u200b\u200c'
+    '\u200d\u200e\u200f\u2060\u2061\u2062\u2063\u2064\ufeff'
+)
+
+
+def _fold_char(ch):
+    """
+    Map one character to exactly one output character, or ``DROP``.
+    Used only to build the translation table.
+    """
+    if ch in ZERO_WIDTH or unicodedata.category(ch) == 'Mn':
+        return DROP
+    if ch.isspace():
+        return ' '
+    # Fullwidth forms, ligature-free compatibility letters and accents.
+    decomposed = unicodedata.normalize('NFKD', ch)
+    base = ''.join(c for c in decomposed if unicodedata.category(c) != 'Mn') or ch
+    if len(base) != 1:
+        base = ch
+    lowered = base.lower()
+    if len(lowered) != 1:
+        lowered = base
+    return CONFUSABLES.get(lowered, lowered)
+
+
+def _build_table():
+    ranges = [
+        range(0x0000, 0x0250),   # ASCII, Latin-1, Latin Extended-A/B
+        range(0x0300, 0x0370),   # combining diacritics
+        range(0x0370, 0x0530),   # Greek, Cyrillic
+        range(0x1e00, 0x1f00),   # Latin Extended Additional (Yoruba dot-below letters)
+        range(0x2000, 0x2070),   # general punctuation, spaces, zero-width
+        range(0xff00, 0xff5f),   # fullwidth ASCII
+    ]
+    table = {}
+    for r in ranges:
+        for code in r:
+            ch = chr(code)
+            folded = _fold_char(ch)
+            if folded != ch:
+                table[code] = folded
+    for ch in ZERO_WIDTH:
+        table[ord(ch)] = DROP
+    table[ord(DROP)] = DROP
+    table[0x3000] = ' '
+    return table
+
+
+FOLD_TABLE = _build_table()
+
+# Code point -> replacement code point for leet characters (0 = not leet).
+LEET_CODES = np.zeros(128, dtype='<u4')
+for _char, _letter in LEET.items():
+    if ord(_char) < 128:
+        LEET_CODES[ord(_char)] = ord(_letter)
+NON_ASCII_LEET = {ord(c): ord(letter) for c, letter in LEET.items() if ord(c) >= 128}
+
+
+def _fold_leet(codes):
+    """
+    Replace leet characters in words that also contain an ASCII letter;
+    ``INFIX_LEET`` characters only between two letters or digits.
+    """
+    ascii_codes = np.where(codes < 128, codes, 0)
+    replacement = LEET_CODES[ascii_codes]
+    for code, letter in NON_ASCII_LEET.items():
+        replacement[codes == code] = letter
+    leet = replacement != 0
+    if not leet.any():
+        return codes
+    letters = (codes >= 0x61) & (codes <= 0x7a)
+    word = np.cumsum(codes == 0x20)
+    word_has_letter = np.bincount(word, weights=letters) > 0
+    leet &= word_has_letter[word]
+
+    alnum = letters | ((codes >= 0x30) & (codes <= 0x39))
+    infix = np.zeros_like(leet)
+    infix[1:-1] = alnum[:-2] & alnum[2:]
+    for char in INFIX_LEET:
+        leet &= (codes != ord(char)) | infix
+    return np.where(leet, replacement, codes)
+
+
+class NormalizedText:
+    """
+    A normalised transcript plus the original index of each of its characters.
+    """
+    __slots__ = ('text', 'offsets', 'original')
+
+    def __init__(self, text, offsets, original):
+        self.text = text
+        self.offsets = offsets
+        self.original = original
+
+    def original_span(self, start, end):
+        """
+        Map a ``[start, end)`` span of the normalised text back to the original.
+        """
+        return int(self.offsets[start]), int(self.offsets[end - 1]) + 1
+
+
+def normalize(text):
+    """
+    Return a ``NormalizedText`` for ``text``. Runs in linear time: one
+    ``translate`` pass plus a few vectorised array passes.
+    """
+    folded = text.translate(FOLD_TABLE)
+    codes = np.frombuffer(folded.encode('utf-32-le', 'surrogatepass'), dtype='<u4')
+    codes = _fold_leet(codes)
+
+    offsets = np.flatnonzero(codes)
+    kept = codes[offsets]
+    # A space is redundant when the previous kept character is also a space.
+    space = kept == 0x20
+    redundant = np.zeros_like(space)
+    redundant[1:] = space[1:] & space[:-1]
+    if redundant.any():
+        offsets = offsets[~redundant]
+        kept = kept[~redundant]
+
+    normalized = kept.tobytes().decode('utf-32-le', 'surrogatepass')
+    return NormalizedText(normalized, offsets, text)
+
+
+def normalize_phrase(phrase):
+    """
+    Normalise a rule phrase the same way transcripts are, trimming the ends.
+    """
+    return normalize(phrase).text.strip()
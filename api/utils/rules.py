@@ -0,0 +1,909 @@
+"""
+Moderator-defined scan rules with a guaranteed linear-time matcher.
+
+Rules are either plain phrases or regular expressions, and they are matched
+against normalised transcripts (see ``api.utils.normalize``): lowercase,
+homoglyphs and accents folded, leetspeak folded inside words, whitespace
+collapsed to single spaces.
+
+Python's ``re`` backtracks, so a pattern such as ``(a+)+$`` can take
+exponential time on a hostile transcript. Instead, patterns are parsed here
+into a small AST and compiled into one Thompson NFA shared by every rule. A
+scan walks that NFA as a DFA whose states are built lazily and cached, so
+each transcript character costs one dictionary lookup once the cache is
+warm, and at most one NFA-sized step when it is not. The DFA cache is capped
+so memory stays bounded too. Anchors (``^``, ``$``) and word boundaries
+(``\\b``, ``\\B``) are supported by resolving them one character late.
+
+Backreferences and lookaheads cannot be expressed as automata. Rules that
+use them are compiled to instructions for a small backtracking matcher that
+keeps its alternatives on an explicit stack, so match length is limited only
+by a step budget. Each such rule gets a budget that grows linearly with the
+transcript, so the worst case stays linear as well, and a rule that runs out
+is skipped without affecting the others. Lookbehinds, possessive quantifiers,
+atomic groups and conditionals are rejected when the rule is saved.
+"""
+import logging
+
+from .metrics import Counter
+from .normalize import DROP, FOLD_TABLE
+
+logger = logging.getLogger(__name__)
+
+rule_budget_exhausted_total = Counter(
+    'scan_rule_budget_exhausted_total', 'Backtracking rule searches that ran out of step budget.',
+)
+
+# Largest bounded repetition count, e.g. ``x{100}``.
+MAX_REPEAT = 100
+# NFA states one rule may compile to; bounds the per-character DFA build cost.
+MAX_RULE_STATES = 2000
+# DFA states cached per rule set before the cache is flushed.
+MAX_DFA_STATES = 10_000
+# Step budget for backtracking rules: BASE + PER_CHAR * len(transcript).
+STEP_BUDGET_BASE = 10_000
+STEP_BUDGET_PER_CHAR = 50
+
+# Character context on each side of a position, for assertions.
+START, WORD, OTHER, END = range(4)
+
+# NFA state kinds.
+CHAR, SPLIT, ASSERT, MATCH = range(4)
+
+
+class RuleError(ValueError):
+    pass
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+def char_class(c):
+    return WORD if c.isalnum() or c == '_' else OTHER
+
+
+def _context(text, pos):
+    left = char_class(text[pos - 1]) if pos > 0 else START
+    right = char_class(text[pos]) if pos < len(text) else END
+    return left, right
+
+
+def _check(assertion, left, right):
+    if assertion == 'bol':
+        return left == START
+    if assertion == 'eol':
+        return right == END
+    at_boundary = (left == WORD) != (right == WORD)
+    return at_boundary if assertion == 'word' else not at_boundary
+
+
+# ---------------------------------------------------------------------------
+# Parsing
+# ---------------------------------------------------------------------------
+#
+# AST nodes are tuples:
+#   ('char', predicate)            one character satisfying predicate(c)
+#   ('cat', [nodes]) / ('alt', [nodes])
+#   ('repeat', node, min, max)     max is None when unbounded
+#   ('group', node, index)         capturing group
+#   ('assert', kind)               'bol', 'eol', 'word' or 'nonword'
+#   ('empty',)
+#   ('backref', index) / ('look', node, negate)   backtracking only
+
+def _fold(ch):
+    folded = FOLD_TABLE.get(ord(ch), ch)
+    return '' if folded == DROP else folded.lower()
+
+
+def _literal(ch):
+    folded = _fold(ch)
+    if not folded:
+        return ('empty',)
+    return ('char', lambda c, folded=folded: c == folded)
+
+
+def _in_ranges(ranges, c):
+    for lo, hi in ranges:
+        if lo <= c <= hi:
+            return True
+    return False
+
+
+SHORTHAND = {
+    'd': lambda c: c.isdigit(),
+    'w': lambda c: c.isalnum() or c == '_',
+    's': lambda c: c.isspace(),
+}
+
+
+def _shorthand(letter):
+    test = SHORTHAND[letter.lower()]
+    if letter.isupper():
+        return lambda c: not test(c)
+    return test
+
+
+class _Parser:
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.pos = 0
+        self.groups = 0
+        self.group_names = {}
+        self.backtracking = False
+
+    def error(self, message):
+        return RuleError(f'{message} at position {self.pos}')
+
+    def peek(self):
+        return self.pattern[self.pos] if self.pos < len(self.pattern) else None
+
+    def take(self):
+        ch = self.peek()
+        if ch is None:
+            raise self.error('unexpected end of pattern')
+        self.pos += 1
+        return ch
+
+    def startswith(self, prefix):
+        return self.pattern.startswith(prefix, self.pos)
+
+    def parse(self):
+        node = self.alternation()
+        if self.peek() is not None:
+            raise self.error("unbalanced ')'")
+        return node
+
+    def alternation(self):
+        branches = [self.sequence()]
+        while self.peek() == '|':
+            self.pos += 1
+            branches.append(self.sequence())
+        return branches[0] if len(branches) == 1 else ('alt', branches)
+
+    def sequence(self):
+        items = []
+        while self.peek() not in (None, '|', ')'):
+            items.append(self.quantified())
+        if not items:
+            return ('empty',)
+        return items[0] if len(items) == 1 else ('cat', items)
+
+    def quantified(self):
+        atom = self.atom()
+        bounds = self.quantifier()
+        if bounds is None:
+            return atom
+        if atom[0] in ('assert', 'look'):
+            raise self.error('nothing to repeat')
+        if self.peek() == '?':
+            # Lazy and greedy quantifiers find the same rule hits.
+            self.pos += 1
+        elif self.peek() == '+':
+            raise self.error('possessive quantifiers are not supported')
+        if self.quantifier() is not None:
+            raise self.error('multiple repeat')
+        return ('repeat', atom, bounds[0], bounds[1])
+
+    def quantifier(self):
+        """
+        Consume a quantifier and return its ``(min, max)``, or ``None``.
+        """
+        ch = self.peek()
+        if ch in ('*', '+', '?'):
+            self.pos += 1
+            return {'*': (0, None), '+': (1, None), '?': (0, 1)}[ch]
+        if ch != '{':
+            return None
+        # Like ``re``, a brace that is not a valid quantifier is a literal.
+        end = self.pattern.find('}', self.pos)
+        if end < 0:
+            return None
+        low, comma, high = self.pattern[self.pos + 1:end].partition(',')
+        if not low.isdigit() or (high and not high.isdigit()):
+            return None
+        low = int(low)
+        high = None if comma and not high else int(high) if high else low
+        if high is not None and high < low:
+            raise self.error('min repeat greater than max repeat')
+        if max(low, high or 0) > MAX_REPEAT:
+            raise self.error(f'repeat counts above {MAX_REPEAT} are not supported')
+        self.pos = end + 1
+        return low, high
+
+    def atom(self):
+        ch = self.take()
+        if ch == '(':
+            return self.group()
+        if ch == '[':
+            return self.char_set()
+        if ch == '.':
+            return ('char', lambda c: c != '\n')
+        if ch == '^':
+            return ('assert', 'bol')
+        if ch == '$':
+            return ('assert', 'eol')
+        if ch == '\\':
+            return self.escape()
+        if ch in '*+?':
+            raise self.error('nothing to repeat')
+        return _literal(ch)
+
+    def group(self):
+        index = None
+        if self.startswith('?'):
+            if self.startswith('?:'):
+                self.pos += 2
+            elif self.startswith('?=') or self.startswith('?!'):
+                negate = self.pattern[self.pos + 1] == '!'
+                self.pos += 2
+                self.backtracking = True
+                node = ('look', self.alternation(), negate)
+                self.close_group()
+                return node
+            elif self.startswith('?<=') or self.startswith('?<!'):
+                raise self.error('lookbehind assertions are not supported')
+            elif self.startswith('?P='):
+                end = self.pattern.find(')', self.pos)
+                name = self.pattern[self.pos + 3:end] if end > 0 else ''
+                if name not in self.group_names:
+                    raise self.error(f'unknown group name {name!r}')
+                self.pos = end + 1
+                self.backtracking = True
+                return ('backref', self.group_names[name])
+            elif self.startswith('?P<'):
+                end = self.pattern.find('>', self.pos)
+                name = self.pattern[self.pos + 3:end] if end > 0 else ''
+                if not name.isidentifier():
+                    raise self.error('bad group name')
+                self.pos = end + 1
+                index = self.new_group()
+                self.group_names[name] = index
+            elif self.startswith('?#'):
+                end = self.pattern.find(')', self.pos)
+                if end < 0:
+                    raise self.error('missing ), unterminated comment')
+                self.pos = end + 1
+                return ('empty',)
+            else:
+                raise self.error('unsupported group syntax')
+        else:
+            index = self.new_group()
+        body = self.alternation()
+        self.close_group()
+        return body if index is None else ('group', body, index)
+
+    def new_group(self):
+        self.groups += 1
+        return self.groups
+
+    def close_group(self):
+        if self.peek() != ')':
+            raise self.error('missing ), unterminated subpattern')
+        self.pos += 1
+
+    def escape(self):
+        ch = self.take()
+        if ch.isdigit() and ch != '0':
+            index = int(ch)
+            if index > self.groups:
+                raise self.error('invalid group reference')
+            self.backtracking = True
+            return ('backref', index)
+        if ch in 'bB':
+            return ('assert', 'word' if ch == 'b' else 'nonword')
+        if ch == 'A':
+            return ('assert', 'bol')
+        if ch in 'Zz':
+            return ('assert', 'eol')
+        if ch.lower() in SHORTHAND:
+            return ('char', _shorthand(ch))
+        return _literal(self.escaped_char(ch))
+
+    def escaped_char(self, ch):
+        controls = {'n': '\n', 't': '\t', 'r': '\r', 'f': '\f', 'v': '\v', '0': '\0'}
+        if ch in controls:
+            return controls[ch]
+        if ch in 'xu':
+            width = 2 if ch == 'x' else 4
+            digits = self.pattern[self.pos:self.pos + width]
+            try:
+                code = int(digits, 16)
+            except ValueError:
+                raise self.error(f'bad escape \\{ch}') from None
+            if len(digits) != width:
+                raise self.error(f'bad escape \\{ch}')
+            self.pos += width
+            return chr(code)
+        if ch.isalnum():
+            raise self.error(f'bad escape \\{ch}')
+        return ch
+
+    def char_set(self):
+        negate = self.peek() == '^'
+        if negate:
+            self.pos += 1
+        ranges = []
+        tests = []
+        first = True
+        while True:
+            ch = self.take()
+            if ch == ']' and not first:
+                break
+            first = False
+            if ch == '\\':
+                escaped = self.take()
+                if escaped.lower() in SHORTHAND:
+                    tests.append(_shorthand(escaped))
+                    continue
+                ch = self.escaped_char(escaped)
+            low = ch
+            if self.peek() == '-' and self.pattern[self.pos + 1:self.pos + 2] not in ('', ']'):
+                self.pos += 1
+                high = self.take()
+                if high == '\\':
+                    high = self.escaped_char(self.take())
+                if high < low:
+                    raise self.error('bad character range')
+                ranges.append((low, high))
+            else:
+                folded = _fold(low) or low
+                ranges.append((folded, folded))
+        ranges = tuple(ranges)
+        tests = tuple(tests)
+
+        def predicate(c):
+            # Transcripts are lowercased, so [A-Z] must still match 'a'.
+            hit = (
+                _in_ranges(ranges, c) or _in_ranges(ranges, c.upper())
+                or any(test(c) for test in tests)
+            )
+            return hit != negate
+        return ('char', predicate)
+
+
+def _reverse(node):
+    """
+    Return the AST matching the reverse of the strings ``node`` matches.
+    """
+    kind = node[0]
+    if kind == 'cat':
+        return ('cat', [_reverse(child) for child in reversed(node[1])])
+    if kind == 'alt':
+        return ('alt', [_reverse(child) for child in node[1]])
+    if kind == 'repeat':
+        return ('repeat', _reverse(node[1]), node[2], node[3])
+    if kind == 'group':
+        return ('group', _reverse(node[1]), node[2])
+    return node
+
+
+def _nullable(node, groups=None):
+    """
+    Whether ``node`` can match without consuming a character in some
+    context. Assertions and lookaheads are assumed to pass; a backreference
+    is empty when its group can be. ``groups`` collects that per group.
+    """
+    if groups is None:
+        groups = {}
+    kind = node[0]
+    if kind == 'char':
+        return False
+    if kind == 'cat':
+        return all([_nullable(child, groups) for child in node[1]])
+    if kind == 'alt':
+        return any([_nullable(child, groups) for child in node[1]])
+    if kind == 'repeat':
+        return _nullable(node[1], groups) or node[2] == 0
+    if kind == 'group':
+        groups[node[2]] = _nullable(node[1], groups)
+        return groups[node[2]]
+    if kind == 'backref':
+        # A forward or nested reference has no verdict yet; assume empty.
+        return groups.get(node[1], True)
+    # 'assert', 'look' and 'empty' are zero-width.
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Automata
+# ---------------------------------------------------------------------------
+
+class NFA:
+    """
+    Thompson NFA stored as parallel lists indexed by state number.
+    """
+    def __init__(self):
+        self.kind = []
+        self.arg = []
+        self.out = []
+
+    def __len__(self):
+        return len(self.kind)
+
+    def add(self, kind, arg=None, out=()):
+        self.kind.append(kind)
+        self.arg.append(arg)
+        self.out.append(list(out))
+        return len(self.kind) - 1
+
+    def compile(self, node, nxt):
+        """
+        Add states for ``node`` continuing to state ``nxt``; return its entry state.
+        """
+        kind = node[0]
+        if kind == 'char':
+            return self.add(CHAR, node[1], [nxt])
+        if kind == 'cat':
+            for child in reversed(node[1]):
+                nxt = self.compile(child, nxt)
+            return nxt
+        if kind == 'alt':
+            return self.add(SPLIT, out=[self.compile(child, nxt) for child in node[1]])
+        if kind == 'group':
+            return self.compile(node[1], nxt)
+        if kind == 'assert':
+            return self.add(ASSERT, node[1], [nxt])
+        if kind == 'empty':
+            return nxt
+        if kind == 'repeat':
+            _, child, low, high = node
+            if high is None:
+                loop = self.add(SPLIT)
+                self.out[loop] = [self.compile(child, loop), nxt]
+                tail = loop
+            else:
+                tail = nxt
+                for _ in range(high - low):
+                    tail = self.add(SPLIT, out=[self.compile(child, tail), nxt])
+            for _ in range(low):
+                tail = self.compile(child, tail)
+            return tail
+        raise RuleError(f'{kind} cannot be compiled to an automaton')
+
+    def closure(self, states, left=None, right=None):
+        """
+        Epsilon closure of ``states``. Assertions are followed only when the
+        surrounding context (``left``, ``right``) is known and satisfies them.
+        """
+        kind, arg, out = self.kind, self.arg, self.out
+        seen = set(states)
+        stack = list(states)
+        while stack:
+            state = stack.pop()
+            if kind[state] == SPLIT:
+                targets = out[state]
+            elif kind[state] == ASSERT and left is not None and _check(arg[state], left, right):
+                targets = out[state]
+            else:
+                continue
+            for target in targets:
+                if target not in seen:
+                    seen.add(target)
+                    stack.append(target)
+        return seen
+
+
+    def nullable(self):
+        """
+        Whether some context lets the NFA match without consuming a character.
+        """
+        seen = {self.start}
+        stack = [self.start]
+        while stack:
+            state = stack.pop()
+            if self.kind[state] == MATCH:
+                return True
+            if self.kind[state] in (SPLIT, ASSERT):
+                for target in self.out[state]:
+                    if target not in seen:
+                        seen.add(target)
+                        stack.append(target)
+        return False
+
+
+def compile_nfa(node):
+    nfa = NFA()
+    match = nfa.add(MATCH, 0)
+    nfa.start = nfa.compile(node, match)
+    return nfa
+
+
+class DFAState:
+    __slots__ = ('nfa_states', 'left', 'transitions')
+
+    def __init__(self, nfa_states, left):
+        self.nfa_states = nfa_states
+        self.left = left
+        # char -> (next DFAState, rule indexes whose match ends before char)
+        self.transitions = {}
+
+
+class Automaton:
+    """
+    Lazily built DFA for unanchored search over several rules at once.
+
+    A DFA state is the set of live NFA states plus the class of the previous
+    character. Assertions are left unresolved until the next character is
+    seen, so a match is reported when the character *after* it is consumed
+    (or by ``finish`` at the end of the text), ending at that position.
+    """
+    def __init__(self, nodes, max_states=MAX_DFA_STATES):
+        self.nfa = NFA()
+        entries = []
+        for index, node in enumerate(nodes):
+            match = self.nfa.add(MATCH, index)
+            entries.append(self.nfa.compile(node, match))
+        self.nfa.start = self.nfa.add(SPLIT, out=entries)
+        self.max_states = max_states
+        self._states = {}
+        self.start = self._state({self.nfa.start}, START)
+
+    def _state(self, nfa_states, left):
+        key = (frozenset(self.nfa.closure(nfa_states)), left)
+        state = self._states.get(key)
+        if state is None:
+            if len(self._states) >= self.max_states:
+                self.flush()
+            state = self._states[key] = DFAState(key[0], left)
+        return state
+
+    def flush(self):
+        # Drop every cached transition so old states can be collected.
+        for state in self._states.values():
+            state.transitions.clear()
+        self._states = {}
+
+    def _accepted(self, nfa_states, left, right):
+        expanded = self.nfa.closure(nfa_states, left, right)
+        kind, arg = self.nfa.kind, self.nfa.arg
+        return expanded, tuple(sorted(arg[s] for s in expanded if kind[s] == MATCH))
+
+    def _transition(self, state, c):
+        right = char_class(c)
+        expanded, accepted = self._accepted(state.nfa_states, state.left, right)
+        kind, arg, out = self.nfa.kind, self.nfa.arg, self.nfa.out
+        moved = {out[s][0] for s in expanded if kind[s] == CHAR and arg[s](c)}
+        # Unanchored search: a new match may start after every character.
+        moved.add(self.nfa.start)
+        result = (self._state(moved, right), accepted)
+        state.transitions[c] = result
+        return result
+
+    def finish(self, state):
+        """
+        Rule indexes whose match ends at the end of the text.
+        """
+        return self._accepted(state.nfa_states, state.left, END)[1]
+
+    def run(self, text, state=None, start=0, min_end=1):
+        """
+        Feed ``text[start:]`` from ``state`` (the start state by default).
+        Returns the final state and ``{rule index: end}`` for the first match
+        of each rule ending at or after ``min_end``, including matches that
+        end exactly at the end of ``text``.
+        """
+        state = self.start if state is None else state
+        found = {}
+        for i in range(start, len(text)):
+            c = text[i]
+            step = state.transitions.get(c)
+            if step is None:
+                step = self._transition(state, c)
+            state, accepted = step
+            if accepted and i >= min_end:
+                for index in accepted:
+                    found.setdefault(index, i)
+        if len(text) >= min_end:
+            for index in self.finish(state):
+                found.setdefault(index, len(text))
+        return state, found
+
+
+def leftmost_start(nfa, text, end):
+    """
+    Run the reversed NFA of a rule backwards from ``end`` and return the
+    smallest start position of a match ending there.
+    """
+    states = nfa.closure({nfa.start}, *_context(text, end))
+    kind, arg, out = nfa.kind, nfa.arg, nfa.out
+    best = end if any(kind[s] == MATCH for s in states) else None
+    pos = end
+    while pos > 0 and states:
+        c = text[pos - 1]
+        pos -= 1
+        moved = {out[s][0] for s in states if kind[s] == CHAR and arg[s](c)}
+        states = nfa.closure(moved, *_context(text, pos))
+        if any(kind[s] == MATCH for s in states):
+            best = pos
+    return best
+
+
+# ---------------------------------------------------------------------------
+# Budgeted backtracking for backreferences and lookaheads
+# ---------------------------------------------------------------------------
+
+class Budget:
+    __slots__ = ('steps',)
+
+    def __init__(self, steps):
+        self.steps = steps
+
+    @classmethod
+    def for_text(cls, text):
+        return cls(STEP_BUDGET_BASE + STEP_BUDGET_PER_CHAR * len(text))
+
+
+# Backtracking instructions. Threads carry ``(pc, position, captures,
+# registers)``; registers hold open group starts and loop entry positions.
+OP_CHAR, OP_SPLIT, OP_JMP, OP_OPEN, OP_CLOSE, OP_BACKREF, OP_ASSERT, OP_LOOK, OP_MARK, OP_CHECK, OP_MATCH = range(11)
+
+
+class Program:
+    """
+    A pattern compiled to instructions for the backtracking matcher.
+    ``SPLIT`` tries its first target and pushes the second onto the
+    backtrack stack, so matching never recurses except into lookaheads.
+    """
+    def __init__(self, node, groups, registers=None):
+        self.groups = groups
+        # Registers 1..groups hold open group starts; loops get the rest.
+        self.registers = groups + 1 if registers is None else registers
+        self.code = []
+        self.emit_node(node)
+        self.code.append((OP_MATCH,))
+        if len(self.code) > MAX_RULE_STATES:
+            raise RuleError(f'pattern compiles to more than {MAX_RULE_STATES} instructions')
+
+    def __len__(self):
+        return len(self.code)
+
+    def emit(self, *instruction):
+        self.code.append(instruction)
+        return len(self.code) - 1
+
+    def patch(self, at, *instruction):
+        self.code[at] = instruction
+
+    def new_register(self):
+        self.registers += 1
+        return self.registers - 1
+
+    def emit_node(self, node):
+        kind = node[0]
+        if kind == 'char':
+            self.emit(OP_CHAR, node[1])
+        elif kind == 'cat':
+            for child in node[1]:
+                self.emit_node(child)
+        elif kind == 'alt':
+            jumps = []
+            for branch in node[1][:-1]:
+                split = self.emit(OP_SPLIT)
+                self.emit_node(branch)
+                jumps.append(self.emit(OP_JMP))
+                self.patch(split, OP_SPLIT, split + 1, len(self.code))
+            self.emit_node(node[1][-1])
+            for jump in jumps:
+                self.patch(jump, OP_JMP, len(self.code))
+        elif kind == 'group':
+            self.emit(OP_OPEN, node[2])
+            self.emit_node(node[1])
+            self.emit(OP_CLOSE, node[2])
+        elif kind == 'repeat':
+            self.emit_repeat(*node[1:])
+        elif kind == 'backref':
+            self.emit(OP_BACKREF, node[1])
+        elif kind == 'assert':
+            self.emit(OP_ASSERT, node[1])
+        elif kind == 'look':
+            # Lookaheads share group numbering and registers with the pattern.
+            body = Program(node[1], self.groups, self.registers)
+            self.registers = body.registers
+            self.emit(OP_LOOK, body, node[2])
+
+    def emit_repeat(self, child, low, high):
+        for _ in range(low):
+            self.emit_node(child)
+        register = self.new_register()
+        if high is None:
+            # Greedy loop; an iteration that consumes nothing would loop forever.
+            loop = self.emit(OP_SPLIT)
+            self.emit(OP_MARK, register)
+            self.emit_node(child)
+            self.emit(OP_CHECK, register)
+            self.emit(OP_JMP, loop)
+            self.patch(loop, OP_SPLIT, loop + 1, len(self.code))
+            return
+        splits = []
+        for _ in range(high - low):
+            splits.append(self.emit(OP_SPLIT))
+            self.emit(OP_MARK, register)
+            self.emit_node(child)
+            self.emit(OP_CHECK, register)
+            if len(self.code) > MAX_RULE_STATES:
+                raise RuleError(f'pattern compiles to more than {MAX_RULE_STATES} instructions')
+        for split in splits:
+            self.patch(split, OP_SPLIT, split + 1, len(self.code))
+
+    def run(self, text, pos, captures, registers, budget, min_end):
+        """
+        Match from ``pos`` and return ``(end, captures)`` for the first
+        match ending at or after ``min_end`` in backtracking order, or
+        ``None``. Every instruction executed spends one unit of ``budget``.
+        """
+        code = self.code
+        n = len(text)
+        stack = [(0, pos, captures, registers)]
+        while stack:
+            pc, i, caps, regs = stack.pop()
+            while True:
+                budget.steps -= 1
+                if budget.steps < 0:
+                    raise BudgetExceeded
+                instruction = code[pc]
+                op = instruction[0]
+                if op == OP_CHAR:
+                    if i >= n or not instruction[1](text[i]):
+                        break
+                    i += 1
+                    pc += 1
+                elif op == OP_SPLIT:
+                    stack.append((instruction[2], i, caps, regs))
+                    pc = instruction[1]
+                elif op == OP_JMP:
+                    pc = instruction[1]
+                elif op == OP_OPEN or op == OP_MARK:
+                    slot = instruction[1]
+                    regs = regs[:slot] + (i,) + regs[slot + 1:]
+                    pc += 1
+                elif op == OP_CHECK:
+                    if regs[instruction[1]] == i:
+                        break
+                    pc += 1
+                elif op == OP_CLOSE:
+                    index = instruction[1]
+                    caps = caps[:index] + ((regs[index], i),) + caps[index + 1:]
+                    pc += 1
+                elif op == OP_BACKREF:
+                    span = caps[instruction[1]]
+                    if span is None:
+                        break
+                    length = span[1] - span[0]
+                    if not text.startswith(text[span[0]:span[1]], i):
+                        break
+                    i += length
+                    pc += 1
+                elif op == OP_ASSERT:
+                    if not _check(instruction[1], *_context(text, i)):
+                        break
+                    pc += 1
+                elif op == OP_LOOK:
+                    hit = instruction[1].run(text, i, caps, regs, budget, 0) is not None
+                    if hit == instruction[2]:
+                        break
+                    pc += 1
+                else:
+                    if i < min_end:
+                        break
+                    return i, caps
+        return None
+
+
+def backtrack_search(program, text, budget, min_end=0):
+    """
+    Return the first ``(start, end)`` span of ``text`` matching ``program``
+    with ``end >= min_end``, or ``None``. ``BudgetExceeded`` is raised when
+    ``budget`` runs out; nothing else limits how long a match can be.
+    """
+    captures = (None,) * (program.groups + 1)
+    registers = (None,) * program.registers
+    for begin in range(len(text) + 1):
+        found = program.run(text, begin, captures, registers, budget, min_end)
+        if found is not None:
+            return begin, found[0]
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Rules
+# ---------------------------------------------------------------------------
+
+class Rule:
+    """
+    One compiled scan rule. ``indicator`` is the name reported on a match.
+    """
+    __slots__ = ('indicator', 'pattern', 'kind', 'node', 'groups', 'backtracking', 'program', '_reverse_nfa')
+
+    def __init__(self, indicator, pattern, kind, node, groups, backtracking):
+        self.indicator = indicator
+        self.pattern = pattern
+        self.kind = kind
+        self.node = node
+        self.groups = groups
+        self.backtracking = backtracking
+        self.program = Program(node, groups) if backtracking else None
+        self._reverse_nfa = None
+
+    @property
+    def reverse_nfa(self):
+        if self._reverse_nfa is None:
+            self._reverse_nfa = compile_nfa(_reverse(self.node))
+        return self._reverse_nfa
+
+    def __repr__(self):
+        return f'Rule({self.indicator!r}, {self.pattern!r}, {self.kind!r})'
+
+
+def compile_rule(indicator, pattern, kind='regex'):
+    """
+    Compile a ``'phrase'`` or ``'regex'`` rule, raising ``RuleError`` if the
+    pattern is invalid, unsupported or too large.
+    """
+    if kind == 'phrase':
+        # Local import: normalize_phrase and this module share FOLD_TABLE.
+        from .normalize import normalize_phrase
+        phrase = normalize_phrase(pattern)
+        if not phrase:
+            raise RuleError('phrase is empty after normalisation')
+        node = ('cat', [_literal(ch) for ch in phrase])
+        return Rule(indicator, pattern, kind, node, 0, False)
+    if kind != 'regex':
+        raise RuleError(f'unknown rule kind {kind!r}')
+
+    parser = _Parser(pattern)
+    node = parser.parse()
+    if not parser.backtracking:
+        nfa = compile_nfa(node)
+        if len(nfa) > MAX_RULE_STATES:
+            raise RuleError(f'pattern compiles to {len(nfa)} states; the limit is {MAX_RULE_STATES}')
+        if nfa.nullable():
+            raise RuleError('pattern can match the empty string')
+    elif _nullable(node):
+        raise RuleError('pattern can match the empty string')
+    return Rule(indicator, pattern, kind, node, parser.groups, parser.backtracking)
+
+
+class RuleSet:
+    """
+    A fixed collection of rules: automaton-safe rules share one lazily built
+    DFA, the rest each get a backtracking step budget per scan.
+    """
+    def __init__(self, rules, version=None):
+        self.rules = list(rules)
+        self.version = version
+        self.linear = [rule for rule in self.rules if not rule.backtracking]
+        self.backtracking = [rule for rule in self.rules if rule.backtracking]
+        self.automaton = Automaton([rule.node for rule in self.linear]) if self.linear else None
+
+    def scan(self, text, state=None, offset=0, min_end=1):
+        """
+        Search ``text`` and return ``(state, hits)``, where ``hits`` lists one
+        ``(rule, start, end)`` per matching rule, for its first match ending
+        at or after ``min_end``, in rule order.
+
+        For incremental scanning, ``state`` is the DFA state a previous call
+        returned after reading ``text[:offset]``; only ``text[offset:]`` is
+        fed to the automaton, while the earlier text still serves as context
+        for match starts and backtracking rules.
+        """
+        hits = {}
+        if self.automaton is not None:
+            start = offset if state is not None else 0
+            state, ends = self.automaton.run(text, state, start, min_end)
+            for index, end in ends.items():
+                rule = self.linear[index]
+                start = leftmost_start(rule.reverse_nfa, text, end)
+                # None: the match began before the context we were given.
+                hits[rule] = (0 if start is None else start, end)
+
+        for rule in self.backtracking:
+            try:
+                span = backtrack_search(rule.program, text, Budget.for_text(text), min_end=min_end)
+            except BudgetExceeded:
+                logger.warning('Scan rule step budget exhausted at rule %r', rule.indicator)
+                rule_budget_exhausted_total.inc()
+                continue
+            if span is not None:
+                hits[rule] = span
+        return state, [(rule, *hits[rule]) for rule in self.rules if rule in hits]
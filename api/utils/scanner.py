@@ -0,0 +1,227 @@
+"""
+Indicator matching for chat transcripts.
+
+Transcripts are normalised (see ``api.utils.normalize``) before matching so
+that obfuscated phrases such as "s3nd m0ney", homoglyphs or zero-width
+characters inside words are still found; match spans are reported against
+the original transcript.
+
+Rules are sharded by locale: each shard holds one keyword pack (see
+``api.utils.locales``) plus the active moderator ``ScanRule`` rows for that
+locale, compiled into its own ``RuleSet`` (see ``api.utils.rules``). The
+common shard holds rules without a locale. A scan detects the transcript's
+languages and touches only the matching shards, and each process compiles
+a shard the first time it needs it, so memory follows the locales in use.
+
+Saving or deleting a rule bumps a version number in the shared cache; each
+process drops its shards when it notices the change, checking at most every
+``KITO_RULES_RELOAD_INTERVAL`` seconds.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .locales import COMMON, detect_locales, keyword_packs, resolve_locales
+from .normalize import normalize
+from .rules import RuleError, RuleSet, compile_rule
+
+logger = logging.getLogger(__name__)
+
+RULES_VERSION_KEY = 'scan_rules:version'
+
+
+class ShardsNotLoaded(Exception):
+    """
+    Raised by ``IncrementalScanner.feed`` when its loader cannot supply the
+    shards for ``locales`` without compiling them.
+    """
+    def __init__(self, locales):
+        super().__init__(locales)
+        self.locales = locales
+
+
+def bump_rules_version():
+    """
+    Tell every process to rebuild its rule shards.
+    """
+    cache.add(RULES_VERSION_KEY, 0, None)
+    try:
+        cache.incr(RULES_VERSION_KEY)
+    except ValueError:
+        # The key was evicted between add() and incr().
+        cache.set(RULES_VERSION_KEY, 1, None)
+
+
+def load_ruleset(locale, version=None):
+    """
+    Compile the keyword pack for ``locale`` and its active ``ScanRule`` rows.
+    """
+    from ..models import ScanRule
+
+    rules = []
+    pack = keyword_packs().get(locale)
+    if pack is not None:
+        rules.extend(compile_rule(phrase, phrase, 'phrase') for phrase in pack.phrases)
+        rules.extend(compile_rule(indicator, pattern) for indicator, pattern in pack.patterns.items())
+    rows = ScanRule.objects.filter(is_active=True, locale=locale).order_by('id')
+    for row in rows.values('indicator', 'pattern', 'kind'):
+        try:
+            rules.append(compile_rule(row['indicator'], row['pattern'], row['kind']))
+        except RuleError as exc:
+            # Rows are validated on save; this only guards hand-edited data.
+            logger.warning('Skipping invalid scan rule %r: %s', row['indicator'], exc)
+    return RuleSet(rules, version)
+
+
+class RuleSetCache:
+    """
+    The process-wide rule shards, dropped when the shared version changes.
+    """
+    def __init__(self):
+        self.shards = {}
+        self.version = None
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def clear(self):
+        self.shards = {}
+        self.version = None
+
+    def _refresh(self, now):
+        if self.version is not None and now - self.checked_at < getattr(settings, 'KITO_RULES_RELOAD_INTERVAL', 5):
+            return
+        version = cache.get(RULES_VERSION_KEY, 0)
+        if version != self.version:
+            self.shards = {}
+            self.version = version
+        self.checked_at = now
+
+    def cached(self, locales, now=None):
+        """
+        Return the shards for ``locales`` without touching the database, or
+        ``None`` if any of them has to be compiled first.
+        """
+        self._refresh(time.monotonic() if now is None else now)
+        shards = self.shards
+        if all(locale in shards for locale in locales):
+            return [shards[locale] for locale in locales]
+        return None
+
+    def get(self, locales):
+        found = self.cached(locales)
+        if found is not None:
+            return found
+        with self._lock:
+            shards = self.shards
+            for locale in locales:
+                if locale not in shards:
+                    shards[locale] = load_ruleset(locale, self.version)
+            return [shards[locale] for locale in locales]
+
+
+rulesets = RuleSetCache()
+
+
+def get_rulesets(locales):
+    return rulesets.get(locales)
+
+
+def _report(hits, normalized, boundary=None, lead=0):
+    """
+    Turn ``(rule, start, end)`` hits into one match dict per indicator, with
+    offsets into the original text. For incremental scans, ``boundary`` is
+    where the message starts in the scanned window; earlier starts are
+    clamped to the message and flagged as ``carried_over``.
+    """
+    shift = boundary or 0
+    matches = []
+    seen = set()
+    for rule, start, end in hits:
+        if rule.indicator in seen or start >= end or end <= shift:
+            continue
+        seen.add(rule.indicator)
+        original_start, original_end = normalized.original_span(max(start - shift, 0) + lead, end - shift + lead)
+        match = {'indicator': rule.indicator, 'start': original_start, 'end': original_end}
+        if boundary is not None:
+            match['carried_over'] = start < shift
+        matches.append(match)
+    return matches
+
+
+def scan_transcript(transcript, locale=None):
+    """
+    Return ``(matches, locales)``: one ``{'indicator', 'start', 'end'}`` dict
+    per indicator found in ``transcript``, with offsets into the original
+    text, and the locales that were scanned. ``locale`` overrides detection.
+    """
+    normalized = normalize(transcript)
+    locales = resolve_locales(detect_locales(normalized.text, transcript), locale)
+    hits = []
+    for ruleset in get_rulesets(locales):
+        hits.extend(ruleset.scan(normalized.text)[1])
+    return _report(hits, normalized), [locale for locale in locales if locale != COMMON]
+
+
+def find_indicators(transcript, locale=None):
+    return scan_transcript(transcript, locale)[0]
+
+
+class IncrementalScanner:
+    """
+    Scans a conversation one message at a time. For each shard, the
+    automaton state reached at the end of the previous message is carried
+    over, so each message is read exactly once and rules spanning messages
+    still match. Locales detected anywhere in the conversation stay active.
+    A short tail of earlier normalised text is kept as context for match
+    starts, backtracking rules and shards that join mid-conversation.
+    """
+    __slots__ = ('tail', 'locales', 'states')
+
+    # Messages are joined by a single space when matching across them.
+    SEPARATOR = ' '
+    CONTEXT = 256
+
+    def __init__(self):
+        self.tail = ''
+        self.locales = set()
+        # locale -> (RuleSet, DFA state after the last message)
+        self.states = {}
+
+    def feed(self, message, loader=None):
+        """
+        Return matches completed by ``message``. Offsets are relative to the
+        message; ``carried_over`` marks matches that began in earlier messages.
+
+        ``loader`` maps a list of locales to their shards (``get_rulesets`` by
+        default); if it returns ``None``, ``ShardsNotLoaded`` is raised before
+        any state changes, so the call can be retried.
+        """
+        normalized = normalize(message)
+        # Whitespace was already collapsed, so at most one space at each end.
+        lead = 1 if normalized.text.startswith(' ') else 0
+        body = normalized.text[lead:].rstrip(' ')
+        if not body:
+            return []
+        detected = self.locales | detect_locales(normalized.text, message)
+        locales = resolve_locales(detected)
+        shards = (loader or get_rulesets)(locales)
+        if shards is None:
+            raise ShardsNotLoaded(locales)
+        self.locales = detected
+
+        prefix = self.tail + self.SEPARATOR if self.tail else ''
+        window = prefix + body
+        boundary = len(prefix)
+        hits = []
+        for locale, ruleset in zip(locales, shards):
+            carried = self.states.get(locale)
+            # A rebuilt shard replays the kept tail from its start state.
+            state = carried[1] if carried is not None and carried[0] is ruleset else None
+            state, shard_hits = ruleset.scan(window, state, offset=len(self.tail), min_end=boundary + 1)
+            self.states[locale] = (ruleset, state)
+            hits.extend(shard_hits)
+        self.tail = window[-self.CONTEXT:]
+        return _report(hits, normalized, boundary=boundary, lead=lead)
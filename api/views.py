@@ -2,29 +2,47 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
 from rest_framework.permissions import AllowAny
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from rest_framework_simplejwt.tokens import RefreshToken
-from drf_spectacular.utils import extend_schema, OpenApiExample
+from django.http import HttpResponse
+from drf_spectacular.utils import extend_schema, OpenApiExample, OpenApiParameter
 from .serializers import SignUpSerializer, LoginSerializer, UserProfileSerializer
-from .models import BlacklistedToken
+from .hashers import check_login_password
+from .idempotency import IdempotentMixin
+from .models import BlacklistedToken, ScanRecord
+from .pagination import KeysetPagination
+from .renderers import NDJSONStreamingResponse
+from .throttling import ScanQuotaThrottle
+from .tokens import refresh_token_for
+from .backends import users_with_email
 from .utils.email import send_welcome_email
-import re
+from .utils.archives import ArchiveError, get_image_pool, open_archive, scan_archive
+from .utils.classifier import score_transcripts
+from .utils.locales import available_locales
+from .utils.scanner import scan_transcript
+from .utils.metrics import render_metrics
 import logging
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
+IDEMPOTENCY_KEY = OpenApiParameter(
+    'Idempotency-Key', str, OpenApiParameter.HEADER,
+    description='Unique key per logical request; retries with the same key replay the first response.',
+)
+
 
 # ------------------------------
 # USER REGISTRATION 
 # ------------------------------
 @extend_schema(tags=['Auth'])
-class SignUpView(APIView):
+class SignUpView(IdempotentMixin, APIView):
     permission_classes = [AllowAny]
 
     @extend_schema(
         request=SignUpSerializer,
         responses={201: dict, 400: dict},
+        parameters=[IDEMPOTENCY_KEY],
         examples=[
             OpenApiExample(
                 'Signup Example',
@@ -59,9 +77,9 @@ class LoginView(APIView):
             password = serializer.validated_data['password']
 
             try:
-                user = User.objects.get(email=email)
-                if user.check_password(password):
-                    refresh = RefreshToken.for_user(user)
+                user = users_with_email(email).get()
+                if check_login_password(user, password):
+                    refresh = refresh_token_for(user)
                     return Response({
                         'access': str(refresh.access_token),
                         'refresh': str(refresh),
@@ -116,46 +134,214 @@ class UserProfileView(APIView):
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+# ------------------------------
+# METRICS
+# ------------------------------
+@extend_schema(exclude=True)
+class MetricsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def record_scans(user, kind, results):
+    """
+    Add scan results to the user's history; anonymous scans are not kept.
+    """
+    if not user.is_authenticated or not results:
+        return
+    ScanRecord.objects.bulk_create([
+        ScanRecord(
+            user=user,
+            kind=kind,
+            verdict=ScanRecord.FLAGGED if result['kito_indicators'] else ScanRecord.SAFE,
+            confidence=result['confidence'],
+            indicators=result['kito_indicators'],
+        )
+        for result in results
+    ])
+
+
 # ------------------------------
 # IMAGE SCAN 
 # ------------------------------
 @extend_schema(tags=['AI'])
-class ImageScanView(APIView):
+class ImageScanView(IdempotentMixin, APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [ScanQuotaThrottle]
+    # Archive results are written to the scan history in batches of this size.
+    record_batch_size = 100
 
-    @extend_schema(request=None, responses={200: dict})
+    @extend_schema(
+        request={'multipart/form-data': {'type': 'object', 'properties': {'archive': {'type': 'string', 'format': 'binary'}}}},
+        responses={200: dict},
+        parameters=[IDEMPOTENCY_KEY],
+        description='Send a ZIP archive of images as "archive" to receive one NDJSON line per image.',
+    )
     def post(self, request):
+        upload = request.FILES.get('archive')
+        if upload is not None:
+            return self.scan_archive(request, upload)
+        # Placeholder for single images: nothing is analysed, so nothing goes
+        # into the scan history.
         return Response({
             'status': 'success',
             'message': 'Image analyzed. No kito indicators found.'
         })
 
+    def scan_archive(self, request, upload):
+        try:
+            archive, members = self.open_archive(request, upload)
+        except ArchiveError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        results = scan_archive(archive, members, get_image_pool())
+        return NDJSONStreamingResponse(self.recorded(request.user, results))
+
+    @staticmethod
+    def open_archive(request, upload):
+        """
+        ``open_archive`` for this request's upload. The central directory is
+        parsed once and kept on the request, since the quota throttle needs
+        the member count before the view runs.
+        """
+        if not hasattr(request, 'opened_archive'):
+            try:
+                request.opened_archive = open_archive(upload)
+            except ArchiveError as exc:
+                request.opened_archive = exc
+        if isinstance(request.opened_archive, ArchiveError):
+            raise request.opened_archive
+        return request.opened_archive
+
+    def recorded(self, user, results):
+        batch = []
+        for result in results:
+            if result.get('status') == 'success':
+                batch.append(result)
+                if len(batch) >= self.record_batch_size:
+                    record_scans(user, ScanRecord.IMAGE, batch)
+                    batch = []
+            yield result
+        record_scans(user, ScanRecord.IMAGE, batch)
+
+    def scan_cost(self, request):
+        upload = request.FILES.get('archive')
+        if upload is None:
+            return 1
+        try:
+            _, members = self.open_archive(request, upload)
+        except ArchiveError:
+            return 1
+        return max(len(members), 1)
+
 
 # ------------------------------
 # CHAT SCAN 
 # ------------------------------
 @extend_schema(tags=['AI'])
-class ChatScanView(APIView):
+class ChatScanView(IdempotentMixin, APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [ScanQuotaThrottle]
 
     @extend_schema(
         request=dict,
         responses={200: dict},
+        parameters=[IDEMPOTENCY_KEY],
         examples=[
             OpenApiExample(
                 'Chat Scan Example',
                 value={"transcript": "Hey baby, send me money now."}
+            ),
+            OpenApiExample(
+                'Batch Chat Scan Example',
+                value={"transcripts": ["Hey baby, send me money now.", "How was your day?"]}
+            ),
+            OpenApiExample(
+                'Localised Chat Scan Example',
+                value={"transcript": "Abeg send money, no tell your mama", "locale": "pcm"}
             )
         ]
     )
     def post(self, request):
+        locale = request.data.get('locale') or None
+        if locale is not None and locale not in available_locales():
+            return Response(
+                {'error': f'locale must be one of {", ".join(available_locales())}'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        max_length = settings.KITO_CHAT_MAX_TRANSCRIPT_LENGTH
+        transcripts = request.data.get('transcripts')
+        if transcripts is not None:
+            if not isinstance(transcripts, list) or not all(isinstance(t, str) for t in transcripts):
+                return Response({'error': 'transcripts must be a list of strings'}, status=status.HTTP_400_BAD_REQUEST)
+            if any(len(t) > max_length for t in transcripts):
+                return Response(
+                    {'error': f'each transcript must be at most {max_length} characters'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            confidences = score_transcripts(transcripts)
+            results = [self.scan(t, c, locale) for t, c in zip(transcripts, confidences)]
+            record_scans(request.user, ScanRecord.CHAT, results)
+            return Response({
+                'status': 'success',
+                'results': results
+            })
+
         transcript = request.data.get('transcript', '')
-        kito_keywords = ['send me money', 'urgent transfer', 'sugar daddy', 'private snap']
+        if not isinstance(transcript, str):
+            return Response({'error': 'transcript must be a string'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(transcript) > max_length:
+            return Response(
+                {'error': f'transcript must be at most {max_length} characters'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        result = self.scan(transcript, score_transcripts([transcript])[0], locale)
+        record_scans(request.user, ScanRecord.CHAT, [result])
+        return Response({'status': 'success', **result})
 
-        detected = [kw for kw in kito_keywords if re.search(kw, transcript, re.IGNORECASE)]
+    @staticmethod
+    def scan_cost(request):
+        transcripts = request.data.get('transcripts')
+        return len(transcripts) if isinstance(transcripts, list) and transcripts else 1
 
-        return Response({
-            'status': 'success',
+    @staticmethod
+    def scan(transcript, confidence, locale=None):
+        matches, locales = scan_transcript(transcript, locale)
+        detected = [match['indicator'] for match in matches]
+
+        return {
             'kito_indicators': detected,
+            'matches': matches,
+            'locales': locales,
+            'confidence': confidence,
             'message': 'Potential threat detected' if detected else 'Safe conversation'
-        })
+        }
+
+
+# ------------------------------
+# SCAN HISTORY
+# ------------------------------
+@extend_schema(tags=['AI'])
+class ScanHistoryView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(
+        responses={200: dict},
+        parameters=[
+            OpenApiParameter('verdict', str, enum=[choice for choice, _ in ScanRecord.VERDICT_CHOICES]),
+            OpenApiParameter('cursor', str),
+            OpenApiParameter('page_size', int),
+        ],
+    )
+    def get(self, request):
+        queryset = ScanRecord.objects.filter(user=request.user)
+        verdict = request.query_params.get('verdict')
+        if verdict:
+            if verdict not in dict(ScanRecord.VERDICT_CHOICES):
+                return Response({'error': 'verdict must be "safe" or "flagged"'}, status=status.HTTP_400_BAD_REQUEST)
+            queryset = queryset.filter(verdict=verdict)
+
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(queryset.values(*ScanRecord.LISTED_FIELDS), request, view=self)
+        return paginator.get_paginated_response(page)
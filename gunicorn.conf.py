@@ -0,0 +1,9 @@
+# Load the Django app in the master before forking so that memory-mapped
+# scan artifacts and the models built on them are shared by all workers.
+preload_app = True
+
+
+def when_ready(server):
+    from api.utils.artifacts import preload_artifacts
+
+    preload_artifacts()
@@ -2,6 +2,8 @@
 ASGI config for kitodeck project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests go to Django; WebSocket connections are routed to the
+streaming chat monitor in ``api.streaming``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -13,4 +15,16 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'kitodeck.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up, since it reads settings at import time.
+from api.streaming import CHAT_MONITOR_PATH, chat_monitor_app  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        if scope['path'] == CHAT_MONITOR_PATH:
+            return await chat_monitor_app(scope, receive, send)
+        await receive()
+        return await send({'type': 'websocket.close'})
+    return await django_application(scope, receive, send)
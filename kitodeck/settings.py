@@ -1,8 +1,9 @@
 from datetime import timedelta
-from decouple import config
+from decouple import Csv, config
 import os
 from pathlib import Path
 import dj_database_url
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -42,18 +43,22 @@ INSTALLED_APPS = [
     'api',
 ]
 
+# Session, CSRF, auth and message middleware are wrapped so they are skipped for
+# STATELESS_PATH_PREFIXES (JWT-only API routes) and still run for /admin/ and the rest.
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'api.middleware.SessionMiddleware',
+    'api.middleware.WhiteNoiseMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
+    'api.middleware.CsrfViewMiddleware',
+    'api.middleware.AuthenticationMiddleware',
+    'api.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware', # CORS
 ]
 
+STATELESS_PATH_PREFIXES = ['/api/']
+
 # Allow frontend requests (modify for production)
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",  
@@ -62,6 +67,7 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 CORS_ALLOW_CREDENTIALS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
 
 ROOT_URLCONF = 'kitodeck.urls'
 
@@ -100,6 +106,26 @@ DATABASES = {
 #     }
 # }
 
+# Cache
+# A shared Redis cache is required for cross-worker state (metrics, quotas);
+# without REDIS_URL each process falls back to its own local-memory cache.
+
+REDIS_URL = config('REDIS_URL', default=None)
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -143,6 +169,19 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+# The first hasher encodes new passwords; hashes made by the others (or at a
+# different cost) are re-encoded on the next successful login.
+PASSWORD_HASHERS = [
+    'api.hashers.CalibratedPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+# PBKDF2 iterations for new and rehashed passwords (0 = Django's default);
+# see `manage.py calibrate_password_hashers`.
+KITO_PBKDF2_ITERATIONS = config('KITO_PBKDF2_ITERATIONS', default=0, cast=int)
+
 AUTHENTICATION_BACKENDS = [
     'api.backends.EmailOrUsernameModelBackend',
     'django.contrib.auth.backends.ModelBackend',
@@ -151,7 +190,17 @@ AUTHENTICATION_BACKENDS = [
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
-        'rest_framework.authentication.SessionAuthentication',
+    ),
+    # Byte-compatible with DRF's JSON renderer/parser; fall back to the stdlib without orjson.
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'api.renderers.NDJSONRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_PERMISSION_CLASSES': [
@@ -236,6 +285,10 @@ SIMPLE_JWT = {
     'JTI_CLAIM': 'jti',
 }
 
+# Record issued refresh tokens in the compact api.TokenLedgerEntry table instead of
+# simplejwt's OutstandingToken. Purge expired rows with `manage.py purge_expired_tokens`.
+KITO_TOKEN_LEDGER = config('KITO_TOKEN_LEDGER', default=True, cast=bool)
+
 
 # SMTP CONFIGURATION
 EMAIL_BACKEND = config('EMAIL_BACKEND')
@@ -246,3 +299,48 @@ EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD') 
 DEFAULT_FROM_EMAIL="KitoDeck AI <no-reply@kitodeck.ai>"
 
+
+# SCAN ENGINE
+# Directory of memory-mapped model artifacts (built with `manage.py build_scan_artifacts`).
+# The chat classifier falls back to the bundled seed model when its artifact is missing.
+KITO_ARTIFACT_DIR = config('KITO_ARTIFACT_DIR', default=os.path.join(BASE_DIR, 'artifacts'))
+# Seconds between checks for atomically swapped artifacts.
+KITO_ARTIFACT_RELOAD_INTERVAL = config('KITO_ARTIFACT_RELOAD_INTERVAL', default=30, cast=int)
+
+# Longest chat transcript accepted for a scan, in characters.
+KITO_CHAT_MAX_TRANSCRIPT_LENGTH = config('KITO_CHAT_MAX_TRANSCRIPT_LENGTH', default=100_000, cast=int)
+
+# Keyword pack locales scanned for every transcript, on top of detected ones.
+KITO_DEFAULT_LOCALES = config('KITO_DEFAULT_LOCALES', default='en', cast=Csv())
+# Seconds between checks for edited scan rules (see api.ScanRule).
+KITO_RULES_RELOAD_INTERVAL = config('KITO_RULES_RELOAD_INTERVAL', default=5, cast=int)
+
+# Daily scan quotas (0 disables), kept in the cache and written behind to
+# api.ScanUsage every KITO_USAGE_FLUSH_INTERVAL seconds.
+KITO_SCAN_DAILY_QUOTA = config('KITO_SCAN_DAILY_QUOTA', default=1000, cast=int)
+KITO_ANON_SCAN_DAILY_QUOTA = config('KITO_ANON_SCAN_DAILY_QUOTA', default=100, cast=int)
+KITO_USAGE_FLUSH_INTERVAL = config('KITO_USAGE_FLUSH_INTERVAL', default=30, cast=int)
+
+# Archive image scans: worker processes (0 = analyse in the request thread),
+# zip bomb limits on declared and actual sizes, and a per-image pixel cap.
+KITO_IMAGE_WORKERS = config('KITO_IMAGE_WORKERS', default=2, cast=int)
+KITO_ARCHIVE_MAX_MEMBERS = config('KITO_ARCHIVE_MAX_MEMBERS', default=1000, cast=int)
+KITO_ARCHIVE_MAX_MEMBER_BYTES = config('KITO_ARCHIVE_MAX_MEMBER_BYTES', default=20 * 1024 * 1024, cast=int)
+KITO_ARCHIVE_MAX_TOTAL_BYTES = config('KITO_ARCHIVE_MAX_TOTAL_BYTES', default=512 * 1024 * 1024, cast=int)
+KITO_ARCHIVE_MAX_RATIO = config('KITO_ARCHIVE_MAX_RATIO', default=100, cast=int)
+KITO_IMAGE_MAX_PIXELS = config('KITO_IMAGE_MAX_PIXELS', default=40_000_000, cast=int)
+# Images per worker job; features are extracted for a whole batch at once.
+KITO_IMAGE_BATCH_SIZE = config('KITO_IMAGE_BATCH_SIZE', default=16, cast=int)
+
+# Idempotency-Key support on signup and scan POSTs: how long completed
+# responses are kept for replay, how long a request may hold its key, the
+# Retry-After sent to a concurrent retry, and the largest response stored.
+KITO_IDEMPOTENCY_TTL = config('KITO_IDEMPOTENCY_TTL', default=24 * 60 * 60, cast=int)
+KITO_IDEMPOTENCY_LOCK_TIMEOUT = config('KITO_IDEMPOTENCY_LOCK_TIMEOUT', default=300, cast=int)
+KITO_IDEMPOTENCY_RETRY_AFTER = config('KITO_IDEMPOTENCY_RETRY_AFTER', default=1, cast=int)
+KITO_IDEMPOTENCY_MAX_BYTES = config('KITO_IDEMPOTENCY_MAX_BYTES', default=1024 * 1024, cast=int)
+
+# Real-time chat monitor: per-worker cap on tracked conversations and idle eviction timeout.
+KITO_STREAM_MAX_CONVERSATIONS = config('KITO_STREAM_MAX_CONVERSATIONS', default=10000, cast=int)
+KITO_STREAM_IDLE_SECONDS = config('KITO_STREAM_IDLE_SECONDS', default=900, cast=int)
+